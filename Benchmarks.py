@@ -0,0 +1,161 @@
+import random
+import sys
+import time
+import tracemalloc
+import copy
+import numpy as np
+import StatevectorSimulator
+import CircuitJSONTools
+from CompactCircuit import CompactCircuit
+import ParameterSweep
+from RandomCircuits import randomCircuit
+
+#Timings for the simulation and editing hot paths. Run them with the benchmark command.
+
+def timeit(function, repeats):
+    """Returns the best of <repeats> wall clock times in seconds."""
+    best = None
+    for _ in range(0, repeats):
+        start = time.perf_counter()
+        function()
+        t = time.perf_counter() - start
+        if best is None or t < best:
+            best = t
+    return best
+
+def benchmarkFusion(rowcount=14, depth=200, repeats=3):
+    """Compares gate by gate application against per column layers and full gate fusion."""
+    circuitjson = randomCircuit(rowcount, depth)
+    rows = circuitjson["rows"]
+
+    def gateByGate():
+        state = StatevectorSimulator.zeroState(rowcount)
+        for x in range(0, depth):
+            for index, row in enumerate(rows):
+                StatevectorSimulator.applyGate(state, row["gates"][x], index, rowcount)
+        return state
+
+    def columnLayers():
+        return StatevectorSimulator.runColumns(StatevectorSimulator.zeroState(rowcount), circuitjson, 0, depth)
+
+    def fused():
+        return StatevectorSimulator.runFused(StatevectorSimulator.zeroState(rowcount), circuitjson, 0, depth)
+
+    reference = gateByGate()
+    if not (np.allclose(reference, columnLayers()) and np.allclose(reference, fused())):
+        print("Fused simulation does not match gate by gate simulation!")
+
+    base = timeit(gateByGate, repeats)
+    results = {"gate by gate": base, "column layers": timeit(columnLayers, repeats), "fused": timeit(fused, repeats)}
+    print("Fusion benchmark:", rowcount, "rows,", depth, "columns")
+    for name, t in results.items():
+        print("  " + name + ": " + str(round(t * 1000, 2)) + " ms (" + str(round(base / t, 2)) + "x)")
+    return results
+
+def allocatedBytes(function):
+    """Returns (result, bytes still allocated by the result)."""
+    tracemalloc.start()
+    result = function()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+def benchmarkCompact(rowcount=50, depth=500, repeats=3):
+    """Compares memory and validation time of list of dict circuit json against the array backed CompactCircuit."""
+    circuitjson, jsonbytes = allocatedBytes(lambda: randomCircuit(rowcount, depth))
+    compact, compactbytes = allocatedBytes(lambda: CompactCircuit.fromJSON(circuitjson))
+    if compact.toJSON() != circuitjson:
+        print("Compact circuit does not round trip to the same json!")
+
+    results = {"json": timeit(lambda: CircuitJSONTools.validateJSON(copy.deepcopy(circuitjson)), repeats) -
+                       timeit(lambda: copy.deepcopy(circuitjson), repeats),
+               "compact": timeit(compact.validate, repeats)}
+    print("Compact circuit benchmark:", rowcount, "rows,", depth, "columns")
+    print("  json: " + str(round(jsonbytes / 1e6, 2)) + " MB, compact: " + str(round(compactbytes / 1e6, 2)) + " MB")
+    for name, t in results.items():
+        print("  validate " + name + ": " + str(round(t * 1000, 2)) + " ms")
+    return results
+
+def randomEdit(circuitjson, rng):
+    """Deletes or inserts one random gate, like a single editor action."""
+    rows = circuitjson["rows"]
+    rowcount = len(rows)
+    col = rng.randrange(0, len(rows[0]["gates"]))
+    row = rng.randrange(0, rowcount)
+    if rng.random() < 0.5 and rows[row]["gates"][col]["type"] != "empty":
+        CircuitJSONTools.deleteGate(circuitjson, row, col)
+    else:
+        gate = {"type": rng.choice(["h", "x", "z", "cx"])}
+        if gate["type"] == "cx":
+            gate["control"] = [rng.choice([r for r in range(0, rowcount) if r != row])]
+        CircuitJSONTools.addGate(circuitjson, gate, row, col)
+
+def benchmarkCompaction(rowcount=12, depth=200, edits=50, seed=0):
+    """Compares the single sweep refactorJSON against the recursive refactorJSONLegacy over an editing session,
+    refactoring a large circuit after every edit like the editor does."""
+    recursionlimit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursionlimit, 100000)) #the legacy version recurses once per pass
+    rng = random.Random(seed)
+    results = {"legacy": 0.0, "sweep": 0.0}
+    mismatches = 0
+    try:
+        circuitjson = CircuitJSONTools.refactorJSONLegacy(randomCircuit(rowcount, depth, seed=seed))
+        for _ in range(0, edits):
+            randomEdit(circuitjson, rng)
+            legacy = copy.deepcopy(circuitjson)
+            results["legacy"] += timeit(lambda: CircuitJSONTools.refactorJSONLegacy(legacy), 1)
+            sweep = copy.deepcopy(circuitjson)
+            results["sweep"] += timeit(lambda: CircuitJSONTools.refactorJSON(sweep), 1)
+            if legacy != sweep:
+                mismatches += 1
+            circuitjson = sweep
+    finally:
+        sys.setrecursionlimit(recursionlimit)
+
+    if mismatches > 0:
+        print("Single sweep compaction does not match the legacy layout after", mismatches, "edits!")
+    base = results["legacy"]
+    print("Compaction benchmark:", rowcount, "rows,", len(circuitjson["rows"][0]["gates"]), "columns,", edits, "edits")
+    for name, t in results.items():
+        print("  " + name + ": " + str(round(t * 1000, 2)) + " ms (" + str(round(base / t, 2)) + "x)")
+    return results
+
+def benchmarkSweep(rowcount=5, depth=40, steps=100, samples=100, seed=0):
+    """Compares a batched steps x steps sweep of two angles against simulating grid points one at a time.
+    The one at a time time is measured on <samples> points and scaled to the whole grid."""
+    circuitjson = randomCircuit(rowcount, depth, singlegates=["h", "rx", "ry", "rz"], seed=seed)
+    cells = [(row, col) for col in range(0, depth) for row in range(0, rowcount)
+             if circuitjson["rows"][row]["gates"][col]["type"] in ["rx", "ry", "rz"]]
+    targets = [cells[0] + (0,), cells[-1] + (0,)]
+    ranges = [np.linspace(-180, 180, steps), np.linspace(-180, 180, steps)]
+    landscape = None
+
+    def batched():
+        nonlocal landscape
+        landscape = ParameterSweep.sweep(circuitjson, targets, ranges)
+
+    rng = random.Random(seed)
+    points = [(rng.randrange(0, steps), rng.randrange(0, steps)) for _ in range(0, samples)]
+    worst = 0.0
+
+    def pointByPoint():
+        nonlocal worst
+        for i, j in points:
+            for (row, col, _), value in zip(targets, [ranges[0][i], ranges[1][j]]):
+                circuitjson["rows"][row]["gates"][col]["params"] = [float(value)]
+            probabilities = StatevectorSimulator.runExact(circuitjson).probabilities
+            worst = max(worst, float(np.max(np.abs(probabilities - landscape[i, j]))))
+
+    results = {"batched": timeit(batched, 1)}
+    results["point by point"] = timeit(pointByPoint, 1) * steps * steps / samples
+    if worst > 1e-6: #runExact rounds params to 6 digits
+        print("Batched sweep does not match point by point simulation!")
+
+    base = results["point by point"]
+    print("Sweep benchmark:", rowcount, "rows,", depth, "columns,", steps, "x", steps, "grid")
+    for name, t in results.items():
+        print("  " + name + ": " + str(round(t * 1000, 2)) + " ms (" + str(round(base / t, 2)) + "x)")
+    return results
+
+benchmarks = {"fusion": benchmarkFusion, "compact": benchmarkCompact, "compaction": benchmarkCompaction,
+              "sweep": benchmarkSweep}
@@ -0,0 +1,77 @@
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+
+#Content addressed caches so an unchanged circuit is never assembled, transpiled or simulated twice.
+
+def canonicalRows(circuitjson, paramdigits=6):
+    """Strips circuit json down to the fields that change what the circuit does."""
+    if not isinstance(circuitjson, dict):
+        return circuitjson.canonicalRows(paramdigits) #compact circuits build the same rows from their arrays
+    rows = []
+    for row in circuitjson["rows"]:
+        cells = []
+        for gatejson in row["gates"]:
+            cell = [gatejson["type"]]
+            if len(gatejson.get("control", [])) > 0:
+                cell.append(list(gatejson["control"]))
+            if len(gatejson.get("params", [])) > 0:
+                cell.append([round(float(p), paramdigits) for p in gatejson["params"]])
+            cells.append(cell)
+        rows.append(cells)
+    return rows
+
+def circuitHash(circuitjson, paramdigits=6):
+    data = json.dumps(canonicalRows(circuitjson, paramdigits), separators=(",", ":"))
+    return hashlib.sha1(data.encode()).hexdigest()
+
+class LRUCache:
+    def __init__(self, name, maxsize=64):
+        self.name = name
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock() #puzzles are prefetched on a background thread
+
+    def get(self, key):
+        """Returns the cached value or None."""
+        with self.lock:
+            if key in self.items:
+                self.hits += 1
+                self.items.move_to_end(key)
+                return self.items[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {"size": len(self.items), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+assembledcache = LRUCache("assembled", 64)
+transpiledcache = LRUCache("transpiled", 64)
+resultcache = LRUCache("results", 128)
+gatecache = LRUCache("gates", 1024) #gate matrices, qiskit operations and multi controlled gate decompositions
+templatecache = LRUCache("templates", 32) #ParametricCircuits by templateKey
+caches = [assembledcache, transpiledcache, resultcache, gatecache, templatecache]
+
+def cacheStats():
+    return {cache.name: cache.stats() for cache in caches}
+
+def clearCaches():
+    for cache in caches:
+        cache.clear()
@@ -6,9 +6,11 @@ from DragAndDropTools import drawDropBox, getGateDropPos, getDeletePos
 import PygameTools
 from PygameTools import config, ClickMode, UIMode
 from errors import InternalCommandException
-from CircuitJSONTools import refactorJSON, addGate, deleteGate, updateGate, assembleCircuit
+from CircuitJSONTools import refactorJSON, addGate, deleteGate, updateGate, OccupancyIndex
+from ParametricCircuit import boundCircuit
 from CustomVisualizations import visualize_transition
 import QCircuitSimulator as qcSIM
+from StatevectorSimulator import IncrementalSimulator
 from PygameTextInput import TextInput
 import warnings
 import pygame
@@ -68,7 +70,9 @@ def editor(circuitjson, title="Custom Circuit Render", gates=None,
         warnings.warn("Puzzle missing validator")
         raise InternalCommandException
 
-    refactorJSON(circuitjson)
+    occupancy = OccupancyIndex()
+    refactorJSON(circuitjson, occupancy)
+    incremental = IncrementalSimulator()
     hand = ""
     handmode = ClickMode.Empty
 
@@ -123,11 +127,11 @@ def editor(circuitjson, title="Custom Circuit Render", gates=None,
                     if col == "end":
                         depth, t = len(circuitjson["rows"][row]["gates"]), "box"
 
-                    elif circuitjson["rows"][row]["gates"][col]["type"] == "empty":
+                    elif occupancy.isFree(row, col):
                         depth, t = col, "box"
 
                     else:
-                        if col > 0 and circuitjson["rows"][row]["gates"][col-1]["type"] == "empty":
+                        if col > 0 and occupancy.isFree(row, col - 1):
                             depth, t = col - 1, "box"
 
                         else:
@@ -180,8 +184,9 @@ def editor(circuitjson, title="Custom Circuit Render", gates=None,
                             elif clickLoc.mode == ClickMode.MoveGate:
                                 row, col = getDeletePos(x, y, circuitjson, config.gateSize)
                                 hand = clickLoc.target
-                                deleteGate(circuitjson, row, col)
-                                circuitjson = refactorJSON(circuitjson)
+                                deleteGate(circuitjson, row, col, occupancy)
+                                incremental.markDirty(col)
+                                circuitjson = refactorJSON(circuitjson, occupancy)
                             elif clickLoc.mode == ClickMode.AddRow:
                                 if clickLoc.target == "add":
                                     length = len(circuitjson["rows"][0]["gates"])
@@ -189,14 +194,14 @@ def editor(circuitjson, title="Custom Circuit Render", gates=None,
                                     for i in range(0, length):
                                         newrow.append({"type": "empty"})
                                     circuitjson["rows"].append({"gates": newrow})
-                                    circuitjson = refactorJSON(circuitjson)
+                                    circuitjson = refactorJSON(circuitjson, occupancy)
                                 else:
                                     warningMessage.warn(clickLoc.target, 100)
 
                             elif clickLoc.mode == ClickMode.DeleteRow:
                                 if clickLoc.target == "del":
                                     circuitjson["rows"].pop()
-                                    circuitjson = refactorJSON(circuitjson)
+                                    circuitjson = refactorJSON(circuitjson, occupancy)
                                 else:
                                     warningMessage.warn(clickLoc.target, 100)
 
@@ -211,36 +216,36 @@ def editor(circuitjson, title="Custom Circuit Render", gates=None,
                                 gatejson["control"] = control
                                 circuitjson["rows"][gaterow]["gates"][colnum] = updateGate(gatejson)
                                 circuitjson["rows"][controlrow]["gates"][colnum] = {"type": "multi"}
-                                circuitjson = refactorJSON(circuitjson)
+                                incremental.markDirty(colnum)
+                                circuitjson = refactorJSON(circuitjson, occupancy)
 
                             elif clickLoc.mode == ClickMode.Command:
                                 if clickLoc.target == "save":
-                                    circuitjson = refactorJSON(circuitjson)
+                                    circuitjson = refactorJSON(circuitjson, occupancy)
                                     done = True
                                     save = True
 
                                 elif clickLoc.target == "view":
-                                    circuitjson = refactorJSON(circuitjson)
+                                    circuitjson = refactorJSON(circuitjson, occupancy)
                                     if editorfig is None:
                                         editorfig = pyplot.figure()
                                     pyplot.ion()
                                     editorfig.clf()
-                                    render(assembleCircuit(circuitjson), circuitjson, [], editorfig)
+                                    render(boundCircuit(circuitjson), circuitjson, [], editorfig)
                                     editorfig.canvas.mpl_connect('close_event', cleanclose)
 
                                 elif clickLoc.target == "play":
-                                    circuitjson = refactorJSON(circuitjson)
-                                    qc = assembleCircuit(circuitjson)
-                                    results = qcSIM.simulate(qc, 1000)
+                                    circuitjson = refactorJSON(circuitjson, occupancy)
+                                    results = qcSIM.simulateJSON(circuitjson, 1000, incremental=incremental)
                                     if editorfig is None:
                                         editorfig = pyplot.figure()
                                     pyplot.ion()
                                     editorfig.clf()
-                                    qcSIM.visualize(results, qc, [], editorfig)
+                                    qcSIM.visualize(results, None, [], editorfig)
                                     editorfig.canvas.mpl_connect('close_event', cleanclose)
 
                                 elif clickLoc.target == "bloch":
-                                    circuitjson = refactorJSON(circuitjson)
+                                    circuitjson = refactorJSON(circuitjson, occupancy)
                                     vgates = True
                                     invgate = ""
                                     for row in circuitjson["rows"]:
@@ -256,22 +261,22 @@ def editor(circuitjson, title="Custom Circuit Render", gates=None,
                                         print("Error. We don't have a visualization for " + invgate + ".")
 
                                 elif clickLoc.target == "check":
-                                    circuitjson = refactorJSON(circuitjson)
-                                    qc = assembleCircuit(circuitjson)
-                                    if validator.validate(qc):
-                                        warningMessage.warn("Circuit solved puzzle!", 120, color=(0, 0, 0))
+                                    circuitjson = refactorJSON(circuitjson, occupancy)
+                                    sampler = qcSIM.shotSampler(circuitjson) if qcSIM.checkbackend == "aer" else None
+                                    passed = validator.validate(circuitjson, sampler)
+                                    shots = "" if validator.shotsused is None else " (" + str(validator.shotsused) + " shots)"
+                                    if passed:
+                                        warningMessage.warn("Circuit solved puzzle!" + shots, 120, color=(0, 0, 0))
                                     else:
-                                        warningMessage.warn("Try again", 120, color=(255,0,0))
+                                        warningMessage.warn("Try again" + shots, 120, color=(255,0,0))
 
                                 elif clickLoc.target == "target":
-                                    circuitjson = refactorJSON(circuitjson)
-                                    qca = assembleCircuit(circuitjson)
-                                    qcb = assembleCircuit(validator.correctcircuitjson)
-                                    resultsa = qcSIM.simulate(qca, 1000)
-                                    resultsb = qcSIM.simulate(qcb, 1000)
+                                    circuitjson = refactorJSON(circuitjson, occupancy)
+                                    resultsb = validator.target
                                     if validator.validationMode == "statevector":
-                                        qcSIM.save_bloch_multivector(resultsa, qca, "blocha")
-                                        qcSIM.save_bloch_multivector(resultsb, qcb, "blochb")
+                                        resultsa = qcSIM.simulateJSON(circuitjson, 1000, incremental=incremental)
+                                        qcSIM.save_bloch_multivector(resultsa, None, "blocha")
+                                        qcSIM.save_bloch_multivector(resultsb, None, "blochb")
 
                                         blocha = pygame.image.load("resources/dynamic/blocha.png")
                                         blochb = pygame.image.load("resources/dynamic/blochb.png")
@@ -289,9 +294,10 @@ def editor(circuitjson, title="Custom Circuit Render", gates=None,
                                         currentmode = UIMode.BlochSphereTargetBoxOpen
 
                                     elif validator.validationMode == "results":
+                                        resultsa = qcSIM.exactJSON(circuitjson)
                                         qcSIM.save_compare_statevector(
-                                            [resultsa.get_counts(qca), resultsb.get_counts(qcb)], ["Current", "Target"],
-                                                                       ['b', 'r'], allkeys=config.statevectorAllKeys)
+                                            [resultsa.get_probabilities(), resultsb.get_probabilities()],
+                                            ["Current", "Target"], ['b', 'r'], allkeys=config.statevectorAllKeys)
                                         svimg = pygame.image.load("resources/dynamic/statevector.png")
                                         r = svimg.get_rect()
                                         if r.w/config.screenW > r.h/config.screenH:
@@ -354,12 +360,14 @@ def editor(circuitjson, title="Custom Circuit Render", gates=None,
                     if hand != "":
                         if handmode == ClickMode.AddGate:
                             row, col = getGateDropPos(x, y, circuitjson, config.gateSize)
-                            addGate(circuitjson, hand, row, col)
-                            circuitjson = refactorJSON(circuitjson)
+                            addGate(circuitjson, hand, row, col, occupancy)
+                            incremental.markDirty(col)
+                            circuitjson = refactorJSON(circuitjson, occupancy)
                         elif handmode == ClickMode.DeleteGate:
                             row, col = getDeletePos(x, y, circuitjson, config.gateSize)
-                            deleteGate(circuitjson, row, col)
-                            circuitjson = refactorJSON(circuitjson)
+                            deleteGate(circuitjson, row, col, occupancy)
+                            incremental.markDirty(col)
+                            circuitjson = refactorJSON(circuitjson, occupancy)
                         elif handmode == ClickMode.AddControl:
                             rownum, col = getDeletePos(x, y, circuitjson, config.gateSize)
 
@@ -374,6 +382,7 @@ def editor(circuitjson, title="Custom Circuit Render", gates=None,
                                         else:
                                             allempty = False
 
+                                    incremental.markDirty(col)
                                     for index, row in enumerate(circuitjson["rows"]):
                                         if allempty:
                                             if index != rownum and index not in control:
@@ -385,14 +394,16 @@ def editor(circuitjson, title="Custom Circuit Render", gates=None,
                                                 row["gates"].insert(col + 1, {"type": "empty"})
                                             else:
                                                 row["gates"].insert(col, {"type": "addcontrol", "control": [rownum]})
+                                    occupancy.rebuild(circuitjson)
 
                                 else:
                                     warningMessage.warn("Can't add control to gate.", 100)
 
                         elif handmode == ClickMode.MoveGate:
                             row, col = getGateDropPos(x, y, circuitjson, config.gateSize)
-                            addGate(circuitjson, hand, row, col)
-                            circuitjson = refactorJSON(circuitjson)
+                            addGate(circuitjson, hand, row, col, occupancy)
+                            incremental.markDirty(col)
+                            circuitjson = refactorJSON(circuitjson, occupancy)
 
                     hand = ""
                     handmode = ClickMode.Empty
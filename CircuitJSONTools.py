@@ -1,7 +1,10 @@
 import warnings
 import json
 from errors import InternalCommandException
-from GateAssembler import createGate, verifyGate, validgates, updateGate
+from GateAssembler import createGate, verifyGate, updateGate, appendGates
+from GateRegistry import gateinfo, validgates, placeholdergates
+from CircuitCache import assembledcache, circuitHash
+from CompactCircuit import CompactCircuit
 
 class Gate:
     def __init__(self, gatestr: str, row, col):
@@ -129,6 +132,8 @@ def compileCircuit(params):
 
 def validateJSON(circuitjson):
     """Loads JSON and warns if there are any errors."""
+    if isinstance(circuitjson, CompactCircuit):
+        return circuitjson.validate()
     if "rows" not in circuitjson or len(circuitjson["rows"]) == 0:
         warnings.warn("Malformed file. Missing rows.")
         raise InternalCommandException
@@ -154,7 +159,7 @@ def validateJSON(circuitjson):
                 warnings.warn("Gate in row #: " + str(rownum) + " missing gate type at gate: " + str(index))
                 raise InternalCommandException
 
-            if gate["type"] not in validgates:
+            if gate["type"] not in gateinfo:
                 warnings.warn("Gate <" + str(gate["type"]) + "> not valid.")
                 raise InternalCommandException
 
@@ -189,30 +194,52 @@ def validateJSON(circuitjson):
     return True
 
 def assembleCircuit(circuitjson, depth=0):
-    """Returns a QuantumCircuit."""
+    """Returns a QuantumCircuit. Assembled circuits are cached by content, callers get their own copy."""
+    if isinstance(circuitjson, CompactCircuit):
+        return circuitjson.assemble(depth)
     rows = circuitjson["rows"]
 
+    if depth == 0:
+        depth = len(rows[0]["gates"])
+
+    key = (circuitHash(circuitjson), depth)
+    qc = assembledcache.get(key)
+    if qc is not None:
+        return qc.copy()
+
     from qiskit import QuantumCircuit
     qc = QuantumCircuit(len(rows), len(rows))
 
-    if depth == 0:
-        depth = len(rows[0]["gates"])
+    #cells in column order, the placeholders that make up most of a circuit are dropped before any dispatch
+    columns = zip(*[row["gates"][0:depth] for row in rows])
+    try:
+        appendGates(qc, [(gatejson, index) for column in columns for index, gatejson in enumerate(column)
+                         if gatejson["type"] not in placeholdergates])
+    except (IndexError, TypeError): #validateJSON checks controls and params, this only catches unvalidated json
+        warnings.warn("Gate with invalid controls or params.")
+        raise InternalCommandException
+    assembledcache.put(key, qc)
+    return qc.copy()
+
+def stageCircuits(circuitjson, every=1):
+    """Generator building the circuit once and yielding (column, circuit prefix) after every <every> columns.
+    The last column is always yielded. Each prefix is a copy, so callers can keep them."""
+    rows = circuitjson["rows"]
+    depth = len(rows[0]["gates"])
+
+    from qiskit import QuantumCircuit
+    qc = QuantumCircuit(len(rows), len(rows))
 
     for x in range(0, depth):
         for index, row in enumerate(rows):
-            createGate(qc, row["gates"][x], index, x, len(rows))
-    return qc
+            if row["gates"][x]["type"] not in placeholdergates:
+                createGate(qc, row["gates"][x], index, x, len(rows))
+        if (x + 1) % every == 0 or x + 1 == depth:
+            yield x + 1, qc.copy()
 
-def preassembleStages(circuitjson):
-    rows = circuitjson["rows"]
-    depth = len(rows[0]["gates"])
-    circuits = []
-    for i in range(1, depth):
-        circuits.append(assembleCircuit(circuitjson, i))
-    for c in circuits:
-        print(c.draw())
-        print("----------------------------------")
-    return circuits
+def preassembleStages(circuitjson, every=1):
+    """Returns the circuit prefix after every <every> columns."""
+    return [qc for _, qc in stageCircuits(circuitjson, every)]
 
 def controlWireArea(gatejson, rownum):
     wirearea = []
@@ -220,8 +247,11 @@ def controlWireArea(gatejson, rownum):
         wirearea += list(range(min(item, rownum) + 1, max(item, rownum)))
     return wirearea
 
-def checkGateLocation(circuitjson, gatejson, gaterow, targetcol, startingcol):
-    """Returns if gate fits and if user should check previous row"""
+def checkGateLocation(circuitjson, gatejson, gaterow, targetcol, startingcol, occupancy=None):
+    """Returns if gate fits and if user should check previous row.
+    With an OccupancyIndex for the circuit the check is a few bitmask tests instead of a scan of the column."""
+    if occupancy is not None:
+        return occupancy.fits(gatejson, gaterow, targetcol, startingcol)
     blockrows = []
     for item in gatejson.get("control", []):
         blockrows.append(item)
@@ -248,11 +278,11 @@ def checkGateLocation(circuitjson, gatejson, gaterow, targetcol, startingcol):
 
     return True, False #empty spot
 
-def placeGate(circuitjson, gatejson, gaterow, targetcol, gatestart):
+def placeGate(circuitjson, gatejson, gaterow, targetcol, gatestart, occupancy=None):
     if targetcol < 0:
         return False
 
-    validloc, prevloc = checkGateLocation(circuitjson, gatejson, gaterow, targetcol, gatestart)
+    validloc, prevloc = checkGateLocation(circuitjson, gatejson, gaterow, targetcol, gatestart, occupancy)
 
     controls = gatejson.get("control", [])
     row = circuitjson["rows"][gaterow]["gates"]
@@ -269,6 +299,9 @@ def placeGate(circuitjson, gatejson, gaterow, targetcol, gatestart):
                 row["gates"].insert(targetcol, {"type": "multi"})
             else:
                 row["gates"].insert(targetcol, {"type": "empty"})
+        if occupancy is not None:
+            occupancy.insertColumn(targetcol, circuitjson)
+            occupancy.updateColumn(targetcol + 1, circuitjson)
         return True
 
     elif validloc and gatestart != targetcol:
@@ -277,18 +310,265 @@ def placeGate(circuitjson, gatejson, gaterow, targetcol, gatestart):
         for item in gatejson.get("control", []):
             circuitjson["rows"][item]["gates"][targetcol] = {"type": "multi"}
             circuitjson["rows"][item]["gates"][gatestart] = {"type": "empty"}
+        if occupancy is not None:
+            occupancy.updateColumn(targetcol, circuitjson)
+            occupancy.updateColumn(gatestart, circuitjson)
         return True
 
     elif prevloc:
-        return placeGate(circuitjson, gatejson, gaterow, targetcol - 1, gatestart) #recursion
+        return placeGate(circuitjson, gatejson, gaterow, targetcol - 1, gatestart, occupancy) #recursion
 
     else:
         return False
 
 
 
-def refactorJSON(circuitjson):
-    """Recursive refactoring of JSON to remove empty lines and such..."""
+def rowsMask(rows):
+    mask = 0
+    for row in rows:
+        mask |= 1 << row
+    return mask
+
+def maskRowsList(mask):
+    rows = []
+    row = 0
+    while mask:
+        if mask & 1:
+            rows.append(row)
+        mask >>= 1
+        row += 1
+    return rows
+
+def lowestRow(mask):
+    return (mask & -mask).bit_length() - 1
+
+class ColumnMasks:
+    """Row bitmasks of one column: rows holding anything, rows holding multi and rows crossed by control wires."""
+    __slots__ = ("occupied", "multi", "wires")
+
+    def __init__(self, column):
+        self.occupied = 0
+        self.multi = 0
+        self.wires = 0
+        for index, gatejson in enumerate(column):
+            gate = gatejson["type"]
+            if gate == "empty":
+                continue
+            self.occupied |= 1 << index
+            if gate == "multi":
+                self.multi |= 1 << index
+            elif "control" in gatejson:
+                self.wires |= rowsMask(controlWireArea(gatejson, index))
+
+    @staticmethod
+    def fromMasks(occupied, multi, wires):
+        masks = ColumnMasks.__new__(ColumnMasks)
+        masks.occupied = occupied
+        masks.multi = multi
+        masks.wires = wires
+        return masks
+
+    def copy(self):
+        return ColumnMasks.fromMasks(self.occupied, self.multi, self.wires)
+
+    def fits(self, gaterow, controlmask, controlarea, samecol):
+        """checkGateLocation on masks. Returns if gate fits and if the previous column should be checked."""
+        if (self.wires >> gaterow) & 1:
+            return False, True
+
+        hardblock = controlmask & ~self.multi
+        if not samecol and (self.occupied >> gaterow) & 1:
+            hardblock |= 1 << gaterow
+        wireblock = controlarea & self.occupied
+
+        if hardblock and (not wireblock or lowestRow(hardblock) <= lowestRow(wireblock)):
+            return False, False #legit block
+        if wireblock:
+            return False, True #wire blocked, check previous level
+        return True, False #empty spot
+
+class OccupancyIndex:
+    """ColumnMasks for every column of a circuit, kept up to date by addGate, deleteGate and refactorJSON
+    so the editor can answer placement queries without rescanning the circuit."""
+    def __init__(self, circuitjson=None):
+        self.columns = []
+        if circuitjson is not None:
+            self.rebuild(circuitjson)
+
+    def rebuild(self, circuitjson):
+        rows = circuitjson["rows"]
+        self.columns = [ColumnMasks([row["gates"][col] for row in rows]) for col in range(0, len(rows[0]["gates"]))]
+
+    def insertColumn(self, col, circuitjson):
+        self.columns.insert(col, ColumnMasks([row["gates"][col] for row in circuitjson["rows"]]))
+
+    def updateColumn(self, col, circuitjson):
+        self.columns[col] = ColumnMasks([row["gates"][col] for row in circuitjson["rows"]])
+
+    def fits(self, gatejson, gaterow, targetcol, startingcol):
+        """Same answer as checkGateLocation: if the gate fits and if the previous column should be checked."""
+        controls = gatejson.get("control", [])
+        return self.columns[targetcol].fits(gaterow, rowsMask(controls), rowsMask(controlWireArea(gatejson, gaterow)),
+                                            targetcol == startingcol)
+
+    def isFree(self, row, col):
+        """If the cell is empty and no control wire crosses it."""
+        masks = self.columns[col]
+        return not ((masks.occupied | masks.wires) >> row) & 1
+
+def refactorJSON(circuitjson, occupancy=None):
+    """Removes empty columns and moves every gate as far left as it fits, in place. Returns circuitjson.
+    Gives the same layout as refactorJSONLegacy for editor built circuits in one left to right sweep: every row tracks
+    the last column it is occupied in, so a single row gate drops straight into the first free column after it that no
+    wire crosses. An OccupancyIndex passed as occupancy that matches the circuit supplies the starting masks, and only
+    its entries for the columns that changed are recomputed afterwards."""
+    if isinstance(circuitjson, CompactCircuit):
+        return circuitjson.refactor()
+    rows = circuitjson["rows"]
+    rowcount = len(rows)
+
+    targetlen = len(rows[0]["gates"])
+    for row in rows:
+        if len(row["gates"]) != targetlen:
+            warnings.warn("Circuit json length error.")
+            raise InternalCommandException
+
+    oldcolumns = [list(column) for column in zip(*[row["gates"] for row in rows])]
+    synced = occupancy is not None and len(occupancy.columns) == targetlen
+    incolumns = []
+    inmasks = []
+    for col, column in enumerate(oldcolumns):
+        column = list(column) #the sweep edits its columns, oldcolumns is kept to find what changed
+        allempty = True
+        converted = False
+        for index, gatejson in enumerate(column):
+            if gatejson["type"] == "addcontrol":
+                #a new cell rather than an edit in place, so the column shows up as changed
+                gatejson = column[index] = {"type": "empty", "control": []}
+                converted = True
+            if gatejson["type"] != "empty":
+                allempty = False
+        if not allempty:
+            incolumns.append(column)
+            #the sweep edits its masks, so indexed ones are copied
+            inmasks.append(occupancy.columns[col].copy() if synced and not converted else ColumnMasks(column))
+
+    columns = []
+    masks = []
+    if len(incolumns) <= 1:
+        columns = incolumns
+        incolumns = []
+
+    lastfilled = [-1] * rowcount #last finished column each row is occupied in
+
+    def slide(gatejson, gaterow, col, controls):
+        """Moves the gate at (gaterow, col) left as far as refactorJSONLegacy would."""
+        if len(controls) == 0:
+            target = lastfilled[gaterow] + 1
+            while target < col and (masks[target].wires >> gaterow) & 1:
+                target += 1
+            if target < col:
+                columns[target][gaterow] = gatejson
+                columns[col][gaterow] = {"type": "empty"}
+                masks[target].occupied |= 1 << gaterow
+                masks[col].occupied &= ~(1 << gaterow)
+                lastfilled[gaterow] = target
+            return
+
+        controlmask = rowsMask(controls)
+        controlarea = rowsMask(controlWireArea(gatejson, gaterow))
+        start = col
+        target = col - 1
+        while target >= 0:
+            validloc, prevloc = masks[target].fits(gaterow, controlmask, controlarea, False)
+            if validloc:
+                columns[target][gaterow] = gatejson
+                columns[col][gaterow] = {"type": "empty"}
+                for item in controls:
+                    columns[target][item] = {"type": "multi"}
+                    columns[col][item] = {"type": "empty"}
+                masks[target] = ColumnMasks(columns[target])
+                masks[col] = ColumnMasks(columns[col])
+                col = target
+                target = col - 1
+            elif prevloc:
+                target -= 1
+            else:
+                break
+        if col != start:
+            for item in [gaterow] + controls:
+                lastfilled[item] = max(lastfilled[item], col)
+
+    for column, mask in zip(incolumns, inmasks):
+        columns.append(column)
+        masks.append(mask)
+        col = len(columns) - 1
+        index = 0
+        while index < rowcount:
+            gatejson = columns[col][index]
+            if gatejson["type"] in ["empty", "multi"]:
+                index += 1
+                continue
+
+            controls = [item for item in gatejson.get("control", []) if type(item) is int and item < rowcount]
+            controlarea = rowsMask(controlWireArea(gatejson, index))
+            if not masks[col].fits(index, rowsMask(controls), controlarea, True)[0]:
+                #the gate started with wires overlapping, so it is forced back into a new column of its own
+                newcolumn = [{"type": "empty"} for _ in range(0, rowcount)]
+                newcolumn[index] = gatejson
+                columns[col][index] = {"type": "empty"}
+                for item in controls:
+                    newcolumn[item] = {"type": "multi"}
+                    columns[col][item] = {"type": "empty"}
+                columns.insert(col, newcolumn)
+                masks.insert(col, ColumnMasks(newcolumn))
+                masks[col + 1] = ColumnMasks(columns[col + 1])
+                slide(gatejson, index, col, controls)
+                for item in maskRowsList(masks[col].occupied):
+                    lastfilled[item] = max(lastfilled[item], col)
+                col += 1
+                index = 0
+                continue
+
+            slide(gatejson, index, col, controls)
+            index += 1
+
+        for item in maskRowsList(masks[col].occupied):
+            lastfilled[item] = max(lastfilled[item], col)
+
+    kept = [column for column in columns if any(gatejson["type"] != "empty" for gatejson in column)]
+    first, oldstop, newstop = writeColumns(circuitjson, oldcolumns, kept)
+    if synced:
+        occupancy.columns[first:oldstop] = [ColumnMasks(column) for column in kept[first:newstop]]
+    elif occupancy is not None:
+        occupancy.rebuild(circuitjson)
+    return circuitjson
+
+def changedColumns(oldcolumns, newcolumns):
+    """(first, oldstop, newstop): oldcolumns[first:oldstop] became newcolumns[first:newstop] and every column around
+    them holds the same cells as before. List comparison checks identity before ==, so unchanged columns are cheap."""
+    limit = min(len(oldcolumns), len(newcolumns))
+    first = 0
+    while first < limit and oldcolumns[first] == newcolumns[first]:
+        first += 1
+    oldstop = len(oldcolumns)
+    newstop = len(newcolumns)
+    while oldstop > first and newstop > first and oldcolumns[oldstop - 1] == newcolumns[newstop - 1]:
+        oldstop -= 1
+        newstop -= 1
+    return first, oldstop, newstop
+
+def writeColumns(circuitjson, oldcolumns, newcolumns):
+    """Writes the refactored columns into the rows in place, touching only the columns that changed.
+    Returns changedColumns."""
+    first, oldstop, newstop = changedColumns(oldcolumns, newcolumns)
+    for index, row in enumerate(circuitjson["rows"]):
+        row["gates"][first:oldstop] = [column[index] for column in newcolumns[first:newstop]]
+    return first, oldstop, newstop
+
+def refactorJSONLegacy(circuitjson):
+    """Recursive refactoring of JSON to remove empty lines and such...
+    Replaced by refactorJSON, kept as the reference layout for the compaction benchmark."""
     madechange = False
     rows = circuitjson["rows"]
 
@@ -336,11 +616,13 @@ def refactorJSON(circuitjson):
                         madechange = True
 
     if madechange:
-        return refactorJSON(circuitjson) #recursion
+        return refactorJSONLegacy(circuitjson) #recursion
     else:
         return circuitjson
 
-def addGate(circuitjson, gate, rownum, colnum):
+def addGate(circuitjson, gate, rownum, colnum, occupancy=None):
+    if isinstance(circuitjson, CompactCircuit):
+        return circuitjson.addGate(gate, rownum, colnum)
     if gate["type"] in "u, cu":
         if len(gate.get("params", [])) == 0:
             gate["params"] = [0,0,0]
@@ -362,8 +644,12 @@ def addGate(circuitjson, gate, rownum, colnum):
                 row["gates"].insert(colnum, {"type": "multi"})
             else:
                 row["gates"].insert(colnum, {"type": "empty"})
+        if occupancy is not None:
+            occupancy.insertColumn(colnum, circuitjson)
 
-def deleteGate(circuitjson, rownum, colnum):
+def deleteGate(circuitjson, rownum, colnum, occupancy=None):
+    if isinstance(circuitjson, CompactCircuit):
+        return circuitjson.deleteGate(rownum, colnum)
     if (rownum is not None) and (colnum is not None):
         gatejson = circuitjson["rows"][rownum]["gates"][colnum]
 
@@ -383,4 +669,7 @@ def deleteGate(circuitjson, rownum, colnum):
         else:
             for item in gatejson.get("control", []):
                 circuitjson["rows"][item]["gates"][colnum] = {"type": "empty"}
-            circuitjson["rows"][rownum]["gates"][colnum] = {"type": "empty"}
\ No newline at end of file
+            circuitjson["rows"][rownum]["gates"][colnum] = {"type": "empty"}
+
+        if occupancy is not None:
+            occupancy.updateColumn(colnum, circuitjson)
\ No newline at end of file
@@ -0,0 +1,497 @@
+import numpy as np
+import warnings
+from errors import InternalCommandException
+from GateAssembler import appendGates, verifyGate, updateGate
+from GateRegistry import gateinfo, validgates
+from CircuitCache import assembledcache, circuitHash
+
+#Array backed circuit model for large circuits. Instead of one dict per cell (25,000 of them for 50x500) a circuit is
+#a gate type code array, a control row bitmask array and a params array, each shaped (rows, depth).
+#Anything the arrays can't hold exactly (control order, int params, extra keys) is kept per cell in the sparse
+#extras dict, so fromJSON / toJSON round trip losslessly.
+
+gatecodes = validgates + ["addcontrol"]
+gatenames = np.array(gatecodes, dtype=object)
+gatecode = {gate: code for code, gate in enumerate(gatecodes)}
+emptycode = gatecode["empty"]
+multicode = gatecode["multi"]
+addcontrolcode = gatecode["addcontrol"]
+maxparams = 3
+controlkind = np.array([3 if gate in gateinfo and gateinfo[gate].multicontrol else
+                        gateinfo[gate].controls if gate in gateinfo else 0 for gate in gatecodes]) #controls verifyGate expects
+paramskind = np.array([gateinfo[gate].params if gate in gateinfo else 0 for gate in gatecodes])
+maxrows = 64 #control masks are uint64
+
+def rowMask(rows):
+    mask = 0
+    for row in rows:
+        mask |= 1 << row
+    return mask
+
+def maskRows(mask):
+    rows = []
+    row = 0
+    while mask:
+        if mask & 1:
+            rows.append(row)
+        mask >>= 1
+        row += 1
+    return rows
+
+def spanMask(a, b):
+    """Rows strictly between a and b."""
+    low, high = min(a, b), max(a, b)
+    return ((1 << high) - 1) & ~((1 << (low + 1)) - 1)
+
+def popCount(masks):
+    """Set bits of every element of a uint64 array."""
+    bits = np.unpackbits(np.ascontiguousarray(masks).view(np.uint8).reshape(masks.shape + (8,)), axis=-1)
+    return bits.sum(axis=-1)
+
+class CompactCircuit:
+    __slots__ = ("types", "controls", "params", "paramcount", "extras")
+
+    def __init__(self, rowcount, depth=0):
+        self.types = np.full((rowcount, depth), emptycode, dtype=np.int16)
+        self.controls = np.zeros((rowcount, depth), dtype=np.uint64)
+        self.params = np.zeros((rowcount, depth, maxparams), dtype=np.float64)
+        self.paramcount = np.zeros((rowcount, depth), dtype=np.int8)
+        self.extras = {} #(row, col): {key: value} for whatever the arrays don't cover
+
+    @property
+    def rowcount(self):
+        return self.types.shape[0]
+
+    @property
+    def depth(self):
+        return self.types.shape[1]
+
+    #region json conversion
+    @staticmethod
+    def fromJSON(circuitjson):
+        rows = circuitjson["rows"]
+        if len(rows) > maxrows:
+            warnings.warn("Compact circuits support at most " + str(maxrows) + " rows.")
+            raise InternalCommandException
+        depth = 0
+        for row in rows:
+            depth = max(depth, len(row["gates"]))
+
+        circuit = CompactCircuit(len(rows), depth)
+        for rownum, row in enumerate(rows):
+            for col, gatejson in enumerate(row["gates"]):
+                circuit.setCell(rownum, col, gatejson)
+        return circuit
+
+    def toJSON(self):
+        return {"rows": [{"gates": [self.cell(row, col) for col in range(0, self.depth)]}
+                         for row in range(0, self.rowcount)]}
+
+    def column(self, col):
+        """Circuit json cells of one column, for engines that read a column at a time."""
+        return [self.cell(row, col) for row in range(0, self.rowcount)]
+
+    def typeNames(self):
+        """The gate type of every cell, as one list per row."""
+        return gatenames[self.types].tolist()
+
+    def setCell(self, row, col, gatejson):
+        gate = gatejson.get("type")
+        if gate not in gatecode:
+            warnings.warn("Gate <" + str(gate) + "> not valid.")
+            raise InternalCommandException
+
+        extra = {}
+        for key, value in gatejson.items():
+            if key not in ["type", "control", "params"]:
+                extra[key] = value
+
+        mask = 0
+        if "control" in gatejson:
+            control = gatejson["control"]
+            if (len(control) > 0 and all(type(item) is int and 0 <= item < maxrows for item in control) and
+                    control == sorted(set(control))):
+                mask = rowMask(control)
+            else:
+                extra["control"] = list(control)
+
+        count = 0
+        if "params" in gatejson:
+            params = gatejson["params"]
+            if 0 < len(params) <= maxparams and all(type(p) in [int, float] for p in params):
+                count = len(params)
+                self.params[row, col, 0:count] = params
+                if any(type(p) is int for p in params):
+                    extra["intparams"] = [type(p) is int for p in params]
+            else:
+                extra["params"] = list(params)
+
+        self.types[row, col] = gatecode[gate]
+        self.controls[row, col] = mask
+        self.paramcount[row, col] = count
+        self.params[row, col, count:] = 0
+        if len(extra) > 0:
+            self.extras[(row, col)] = extra
+        else:
+            self.extras.pop((row, col), None)
+
+    def cell(self, row, col):
+        """Circuit json dict for one cell."""
+        gatejson = {"type": gatecodes[self.types[row, col]]}
+        extra = self.extras.get((row, col), {})
+        if "control" in extra:
+            gatejson["control"] = list(extra["control"])
+        elif self.controls[row, col]:
+            gatejson["control"] = maskRows(int(self.controls[row, col]))
+
+        if "params" in extra:
+            gatejson["params"] = list(extra["params"])
+        elif self.paramcount[row, col] > 0:
+            params = [float(p) for p in self.params[row, col, 0:self.paramcount[row, col]]]
+            if "intparams" in extra:
+                params = [int(p) if isint else p for p, isint in zip(params, extra["intparams"])]
+            gatejson["params"] = params
+
+        for key, value in extra.items():
+            if key not in ["control", "params", "intparams"]:
+                gatejson[key] = value
+        return gatejson
+
+    def controlList(self, row, col):
+        extra = self.extras.get((row, col), {})
+        if "control" in extra:
+            return list(extra["control"])
+        return maskRows(int(self.controls[row, col]))
+
+    def canonicalRows(self, paramdigits=6):
+        """Same as CircuitCache.canonicalRows on the json, without building it."""
+        rows = []
+        for row in range(0, self.rowcount):
+            cells = []
+            for col in range(0, self.depth):
+                cell = [gatecodes[self.types[row, col]]]
+                control = self.controlList(row, col)
+                if len(control) > 0:
+                    cell.append(control)
+                gatejson = self.cell(row, col) if self.paramcount[row, col] or (row, col) in self.extras else {}
+                if len(gatejson.get("params", [])) > 0:
+                    cell.append([round(float(p), paramdigits) for p in gatejson["params"]])
+                cells.append(cell)
+            rows.append(cells)
+        return rows
+    #endregion
+
+    #region column storage
+    def insertColumn(self, col):
+        """Inserts an empty column before col."""
+        self.types = np.insert(self.types, col, emptycode, axis=1)
+        self.controls = np.insert(self.controls, col, 0, axis=1)
+        self.params = np.insert(self.params, col, 0, axis=1)
+        self.paramcount = np.insert(self.paramcount, col, 0, axis=1)
+        self.extras = {(r, c + 1 if c >= col else c): extra for (r, c), extra in self.extras.items()}
+
+    def removeColumns(self, cols):
+        if len(cols) == 0:
+            return
+        self.types = np.delete(self.types, cols, axis=1)
+        self.controls = np.delete(self.controls, cols, axis=1)
+        self.params = np.delete(self.params, cols, axis=1)
+        self.paramcount = np.delete(self.paramcount, cols, axis=1)
+        removed = set(cols)
+        shift = np.cumsum([c in removed for c in range(0, self.depth + len(cols))])
+        self.extras = {(r, c - int(shift[c])): extra for (r, c), extra in self.extras.items() if c not in removed}
+
+    def clearCell(self, row, col):
+        self.types[row, col] = emptycode
+        self.controls[row, col] = 0
+        self.paramcount[row, col] = 0
+        self.extras.pop((row, col), None)
+
+    def moveCell(self, row, source, target):
+        self.types[row, target] = self.types[row, source]
+        self.controls[row, target] = self.controls[row, source]
+        self.params[row, target] = self.params[row, source]
+        self.paramcount[row, target] = self.paramcount[row, source]
+        if (row, source) in self.extras:
+            self.extras[(row, target)] = self.extras.pop((row, source))
+        else:
+            self.extras.pop((row, target), None)
+        self.clearCell(row, source)
+
+    def setType(self, row, col, gate):
+        self.clearCell(row, col)
+        self.types[row, col] = gatecode[gate]
+    #endregion
+
+    #region column masks
+    def columnMask(self, col, code=None):
+        """Bitmask of rows in col that are not empty, or that hold <code>."""
+        if code is None:
+            column = self.types[:, col] != emptycode
+        else:
+            column = self.types[:, col] == code
+        return rowMask(np.nonzero(column)[0].tolist())
+
+    def wireMask(self, row, col):
+        """Rows crossed by the control wires of the cell at (row, col)."""
+        mask = 0
+        for item in self.controlList(row, col):
+            if type(item) is int:
+                mask |= spanMask(item, row)
+        return mask
+
+    def columnWireMask(self, col):
+        mask = 0
+        for row in np.nonzero(self.controls[:, col])[0].tolist():
+            mask |= self.wireMask(row, col)
+        for (row, c), extra in self.extras.items():
+            if c == col and "control" in extra:
+                mask |= self.wireMask(row, col)
+        return mask
+    #endregion
+
+    def validate(self):
+        """Same checks as CircuitJSONTools.validateJSON."""
+        rowcount = self.rowcount
+        if rowcount == 0:
+            warnings.warn("Malformed file. Missing rows.")
+            raise InternalCommandException
+
+        invalid = np.argwhere(self.types == addcontrolcode) #editor only placeholder, never valid in a circuit
+        if len(invalid) > 0:
+            warnings.warn("Gate <addcontrol> not valid.")
+            raise InternalCommandException
+
+        if rowcount < maxrows:
+            cols, rows = np.nonzero((self.controls >> np.uint64(rowcount)).T)
+            if len(cols) > 0:
+                warnings.warn("Gate in row " + str(rows[0]) + " at col " + str(cols[0]) +
+                              " requesting invalid control.")
+                raise InternalCommandException
+        for (row, col), extra in self.extras.items():
+            for item in extra.get("control", []):
+                if not (type(item) is int and item < rowcount):
+                    warnings.warn("Gate in row " + str(row) + " at col " + str(col) + " requesting invalid control.")
+                    raise InternalCommandException
+
+        #control and param counts are checked on the arrays, verifyGate only sees cells that fail (for its warning)
+        #and cells with extras
+        controlcount = popCount(self.controls)
+        kind = controlkind[self.types]
+        paramkind = paramskind[self.types]
+        invalid = (((kind == 1) & (controlcount != 1)) | ((kind == 2) & (controlcount != 2)) |
+                   ((kind == 3) & (controlcount == 0)) | ((paramkind == 1) & (self.paramcount != 1)) |
+                   ((paramkind == 3) & (self.paramcount != 3) & (self.paramcount != 1)))
+        cols, rows = np.nonzero(invalid.T)
+        cells = set(zip(rows.tolist(), cols.tolist())) | set(self.extras.keys())
+        for row, col in sorted(cells, key=lambda cell: (cell[1], cell[0])):
+            verifyGate(self.cell(row, col), row, col, rowcount)
+        return True
+
+    def assemble(self, depth=0):
+        """Returns a QuantumCircuit, sharing the assembled circuit cache with CircuitJSONTools.assembleCircuit."""
+        if depth == 0:
+            depth = self.depth
+
+        key = (circuitHash(self), depth)
+        qc = assembledcache.get(key)
+        if qc is not None:
+            return qc.copy()
+
+        from qiskit import QuantumCircuit
+        qc = QuantumCircuit(self.rowcount, self.rowcount)
+        placeholders = (self.types[:, 0:depth] == emptycode) | (self.types[:, 0:depth] == multicode)
+        cols, rows = np.nonzero(~placeholders.T) #column order
+        appendGates(qc, [(self.cell(row, col), row) for col, row in zip(cols.tolist(), rows.tolist())])
+        assembledcache.put(key, qc)
+        return qc.copy()
+
+    #region editing
+    def addGate(self, gate, rownum, colnum):
+        """Same as CircuitJSONTools.addGate."""
+        if gate["type"] in "u, cu":
+            if len(gate.get("params", [])) == 0:
+                gate["params"] = [0, 0, 0]
+        controls = gate.get("control", [])
+
+        for item in controls: #check if gate is selecting itself for control
+            if item == rownum:
+                controls.remove(item)
+                updateGate(gate)
+
+        if (rownum is not None) and (colnum is not None):
+            if colnum == "end":
+                colnum = self.depth
+            self.insertColumn(colnum)
+            self.setCell(rownum, colnum, gate)
+            for item in controls:
+                if item != rownum and type(item) is int and 0 <= item < self.rowcount:
+                    self.setType(item, colnum, "multi")
+
+    def deleteGate(self, rownum, colnum):
+        """Same as CircuitJSONTools.deleteGate."""
+        if (rownum is not None) and (colnum is not None):
+            code = self.types[rownum, colnum]
+            if code == emptycode:
+                warnings.warn("Deleting empty gate!")
+                raise InternalCommandException
+
+            elif code == multicode:
+                for row in range(0, self.rowcount):
+                    control = self.controlList(row, colnum)
+                    if rownum in control:
+                        control.remove(rownum)
+                        gatejson = self.cell(row, colnum)
+                        gatejson["control"] = control
+                        self.setCell(row, colnum, updateGate(gatejson))
+                self.types[rownum, colnum] = emptycode
+
+            else:
+                for item in self.controlList(rownum, colnum):
+                    self.clearCell(item, colnum)
+                self.clearCell(rownum, colnum)
+
+    def refactor(self):
+        """CircuitJSONTools.refactorJSON on the arrays, same single sweep and same layout. Returns self.
+        The sweep moves flat indices of the old cells (row * depth + col) around instead of cells, plus the
+        placeholder refs below, and the new arrays are gathered from the old ones once at the end."""
+        from CircuitJSONTools import ColumnMasks #CircuitJSONTools imports this module
+        rowcount = self.rowcount
+        depth = self.depth
+        typesflat = self.types.ravel()
+        empty, multi, cleared = -1, -2, -3 #cleared is an addcontrol turned into an empty cell with no controls
+
+        def code(ref):
+            if ref >= 0:
+                return int(typesflat[ref])
+            return multicode if ref == multi else emptycode
+
+        def controls(ref):
+            return [item for item in self.controlList(ref // depth, ref % depth) if type(item) is int and item < rowcount]
+
+        def masksOf(column):
+            occupied = multimask = wires = 0
+            for index, ref in enumerate(column):
+                gate = code(ref)
+                if gate == emptycode:
+                    continue
+                occupied |= 1 << index
+                if gate == multicode:
+                    multimask |= 1 << index
+                elif ref >= 0:
+                    wires |= self.wireMask(index, ref % depth)
+            return ColumnMasks.fromMasks(occupied, multimask, wires)
+
+        incolumns = []
+        for col in range(0, depth):
+            column = [row * depth + col for row in range(0, rowcount)]
+            for index, ref in enumerate(column):
+                if code(ref) == addcontrolcode:
+                    column[index] = cleared
+            if any(code(ref) != emptycode for ref in column):
+                incolumns.append(column)
+
+        columns = []
+        masks = []
+        if len(incolumns) <= 1:
+            columns = incolumns
+            incolumns = []
+
+        lastfilled = [-1] * rowcount #last finished column each row is occupied in
+
+        def slide(ref, gaterow, col, controlrows):
+            """Moves the gate at (gaterow, col) left as far as refactorJSONLegacy would."""
+            if len(controlrows) == 0:
+                target = lastfilled[gaterow] + 1
+                while target < col and (masks[target].wires >> gaterow) & 1:
+                    target += 1
+                if target < col:
+                    columns[target][gaterow] = ref
+                    columns[col][gaterow] = empty
+                    masks[target].occupied |= 1 << gaterow
+                    masks[col].occupied &= ~(1 << gaterow)
+                    lastfilled[gaterow] = target
+                return
+
+            controlmask = rowMask(controlrows)
+            controlarea = self.wireMask(gaterow, ref % depth)
+            start = col
+            target = col - 1
+            while target >= 0:
+                validloc, prevloc = masks[target].fits(gaterow, controlmask, controlarea, False)
+                if validloc:
+                    columns[target][gaterow] = ref
+                    columns[col][gaterow] = empty
+                    for item in controlrows:
+                        columns[target][item] = multi
+                        columns[col][item] = empty
+                    masks[target] = masksOf(columns[target])
+                    masks[col] = masksOf(columns[col])
+                    col = target
+                    target = col - 1
+                elif prevloc:
+                    target -= 1
+                else:
+                    break
+            if col != start:
+                for item in [gaterow] + controlrows:
+                    lastfilled[item] = max(lastfilled[item], col)
+
+        for column in incolumns:
+            columns.append(column)
+            masks.append(masksOf(column))
+            col = len(columns) - 1
+            index = 0
+            while index < rowcount:
+                ref = columns[col][index]
+                if code(ref) in [emptycode, multicode]:
+                    index += 1
+                    continue
+
+                controlrows = controls(ref)
+                controlarea = self.wireMask(index, ref % depth)
+                if not masks[col].fits(index, rowMask(controlrows), controlarea, True)[0]:
+                    #the gate started with wires overlapping, so it is forced back into a new column of its own
+                    newcolumn = [empty] * rowcount
+                    newcolumn[index] = ref
+                    columns[col][index] = empty
+                    for item in controlrows:
+                        newcolumn[item] = multi
+                        columns[col][item] = empty
+                    columns.insert(col, newcolumn)
+                    masks.insert(col, masksOf(newcolumn))
+                    masks[col + 1] = masksOf(columns[col + 1])
+                    slide(ref, index, col, controlrows)
+                    for item in maskRows(masks[col].occupied):
+                        lastfilled[item] = max(lastfilled[item], col)
+                    col += 1
+                    index = 0
+                    continue
+
+                slide(ref, index, col, controlrows)
+                index += 1
+
+            for item in maskRows(masks[col].occupied):
+                lastfilled[item] = max(lastfilled[item], col)
+
+        kept = [column for column in columns if any(code(ref) != emptycode for ref in column)]
+        refs = np.array(kept, dtype=np.int64).reshape(len(kept), rowcount).T
+        moved = refs >= 0
+        source = np.where(moved, refs, 0)
+        placeholders = np.where(refs == multi, multicode, emptycode)
+        self.types = np.where(moved, typesflat[source], placeholders).astype(np.int16)
+        self.controls = np.where(moved, self.controls.ravel()[source], np.uint64(0)).astype(np.uint64)
+        self.params = np.where(moved[..., None], self.params.reshape(-1, maxparams)[source], 0.0)
+        self.paramcount = np.where(moved, self.paramcount.ravel()[source], 0).astype(np.int8)
+
+        extras = {}
+        sources = {row * depth + col: extra for (row, col), extra in self.extras.items()}
+        for row, col in np.argwhere(moved | (refs == cleared)).tolist():
+            ref = int(refs[row, col])
+            if ref == cleared:
+                extras[(row, col)] = {"control": []}
+            elif ref in sources:
+                extras[(row, col)] = sources[ref]
+        self.extras = extras
+        return self
+    #endregion
@@ -1,44 +1,22 @@
 from qiskit import QuantumCircuit
 import warnings
 from errors import InternalCommandException
-from math import radians
-
-validgates = []
-singleparamgates = []
-tripleparamsgates = []
-controlgates = []
-doublecontrolgates = []
-multicontrolgates = []
-
-pauligates = ["x", "y", "z"]
-coremodifiers = ["", "c", "r", "cr", "mcr"]
-universalgates = ["u", "cu"]
-specialgates = ["ccx", "h", "ch", "i"]
-othergates = ["swap", "cswap", "barrier", "reset"]
-customgates = ["empty", "multi", "m", "puzzle"]
-for p in pauligates:
-    for mod in coremodifiers:
-        validgates.append(mod + p)
-        if "c" in mod:
-            if "mc" in mod:
-                multicontrolgates.append(mod + p)
-            else:
-                controlgates.append(mod + p)
-
-        if "r" in mod:
-            singleparamgates.append(mod + p)
-
-validgates += universalgates + specialgates + othergates + customgates
-controlgates += ["cu", "swap"]
-doublecontrolgates += ["ccx", "cswap"]
-tripleparamsgates += ["u", "cu"]
-
+from math import pi
+from qiskit.circuit import Barrier, Measure, Reset
+from qiskit.circuit.library import HGate, CHGate, IGate, XGate, YGate, ZGate, RXGate, RYGate, RZGate, CXGate, CYGate, \
+    CZGate, CRXGate, CRYGate, CRZGate, CCXGate, UGate, CUGate, SwapGate, CSwapGate
+from GateRegistry import gateinfo, variantName, placeholdergates, validgates, singleparamgates, tripleparamsgates, \
+    controlgates, doublecontrolgates, multicontrolgates, gateKey, roundedParams
+from CircuitCache import gatecache
 
 def verifyGate(gatejson, row, col, rowcount):
     gate = gatejson["type"]
+    info = gateinfo.get(gate)
+    if info is None:
+        return
 
     # region validate gates
-    if gate in controlgates or gate in doublecontrolgates or gate in multicontrolgates:
+    if info.controlled:
         if "control" not in gatejson:
             warnings.warn("Gate at (" + str(row) + "," + str(col) + ") has control but is missing control in json.")
             raise InternalCommandException
@@ -51,26 +29,133 @@ def verifyGate(gatejson, row, col, rowcount):
                 warnings.warn("Gate at (" + str(row) + "," + str(col) + ") requesting invalid control.")
                 raise InternalCommandException
 
-        if ((gate in controlgates and len(control) != 1) or (gate in doublecontrolgates and len(control) != 2) or
-                (gate in multicontrolgates and len(control) == 0)):
+        if (info.multicontrol and len(control) == 0) or (not info.multicontrol and len(control) != info.controls):
             warnings.warn("Gate at (" + str(row) + "," + str(col) + ") has unexpected amount of controls.")
             raise InternalCommandException
 
-    if gate in singleparamgates or gate in tripleparamsgates:
+    if info.params > 0:
         if "params" not in gatejson:
             warnings.warn("Gate at (" + str(row) + "," + str(col) + ") has params but is missing params in json.")
             raise InternalCommandException
 
         params = gatejson["params"]
-        if (gate in singleparamgates and len(params) != 1) or (gate in tripleparamsgates and len(params) != 3):
+        if len(params) != info.params:
             if len(params) != 1:
                 warnings.warn("Gate at (" + str(row) + "," + str(col) + ") has unexpected amount of params.")
                 raise InternalCommandException
     # endregion
 
-def createGate(qc: QuantumCircuit, gatejson: dict, row: int, col:int, rowcount:int):
-    gate = gatejson["type"]
+#Instruction constructors, keyed by gate type. Each takes the json params (degrees) and returns the qiskit operation,
+#which is applied to the gate's control rows followed by its own row. Gates without params share one instance,
+#gates with params are built once per rounded params and kept in gatecache.
+#Params are converted with * degree instead of radians() so qiskit Parameters can stand in for them (ParametricCircuit).
+degree = pi / 180 #same constant radians() multiplies by
+hgate, chgate, igate = HGate(), CHGate(), IGate()
+xgate, ygate, zgate = XGate(), YGate(), ZGate()
+cxgate, cygate, czgate, ccxgate = CXGate(), CYGate(), CZGate(), CCXGate()
+swapgate, cswapgate = SwapGate(), CSwapGate()
+barriergate, resetgate, measuregate = Barrier(1), Reset(), Measure()
+
+gatebuilders = {
+    "barrier": lambda params: barriergate,
+    "reset": lambda params: resetgate,
+    "m": lambda params: measuregate,
+    "i": lambda params: igate,
+    "puzzle": lambda params: igate,
+
+    "h": lambda params: hgate,
+    "ch": lambda params: chgate,
+
+    "x": lambda params: xgate,
+    "y": lambda params: ygate,
+    "z": lambda params: zgate,
+
+    "rx": lambda params: RXGate(params[0] * degree),
+    "ry": lambda params: RYGate(params[0] * degree),
+    "rz": lambda params: RZGate(params[0] * degree),
+
+    "cx": lambda params: cxgate,
+    "cy": lambda params: cygate,
+    "cz": lambda params: czgate,
+
+    "crx": lambda params: CRXGate(params[0] * degree),
+    "cry": lambda params: CRYGate(params[0] * degree),
+    "crz": lambda params: CRZGate(params[0] * degree),
+
+    "ccx": lambda params: ccxgate,
+
+    "u": lambda params: UGate(*[p * degree for p in params[0:3]]),
+    "cu": lambda params: CUGate(*[p * degree for p in params[0:3]], 0),
+
+    "swap": lambda params: swapgate,
+    "cswap": lambda params: cswapgate,
+}
+
+#multi controlled rotations are synthesized by QuantumCircuit. Each takes (qc, params, controls, row)
+synthesizedgates = {
+    "mcrx": lambda qc, params, controls, row: qc.mcrx(params[0] * degree, controls, row),
+    "mcry": lambda qc, params, controls, row: qc.mcry(params[0] * degree, controls, row),
+    "mcrz": lambda qc, params, controls, row: qc.mcrz(params[0] * degree, controls, row),
+}
+
+for gate, builder in gatebuilders.items():
+    gateinfo[gate].builder = builder
+for gate, synthesizer in synthesizedgates.items():
+    gateinfo[gate].synthesizer = synthesizer
+
+def gateOperation(info, params):
+    """The qiskit operation of a gate, built once per rounded params."""
+    if info.params == 0:
+        return info.builder(params)
+    key = gateKey("operation", info.name, params)
+    operation = gatecache.get(key)
+    if operation is None:
+        operation = gatecache.put(key, info.builder(roundedParams(params)))
+    return operation
+
+def decomposition(info, params, controlcount):
+    """The instructions qiskit synthesizes for a multi controlled gate, as (operation, qubit positions) on
+    controls 0..controlcount-1 and target controlcount. Synthesized once per rounded params and control count."""
+    key = gateKey("decomposition", info.name, params, controlcount)
+    instructions = gatecache.get(key)
+    if instructions is None:
+        sub = QuantumCircuit(controlcount + 1)
+        info.synthesizer(sub, roundedParams(params), list(range(0, controlcount)), controlcount)
+        positions = {bit: index for index, bit in enumerate(sub.qubits)}
+        instructions = gatecache.put(key, [(operation, [positions[q] for q in qargs])
+                                           for operation, qargs, cargs in sub.data])
+    return instructions
+
+def appendGates(qc: QuantumCircuit, cells, cache=True):
+    """Appends the gates of (gatejson, row) cells to qc in order, skipping placeholders.
+    Expects json that already passed validateJSON: controls aren't checked again and the instructions go straight
+    into the circuit without QuantumCircuit.append's argument broadcasting.
+    With cache=False operations are built from the params as given, which may be qiskit Parameters."""
+    qubits = qc.qubits
+    clbits = qc.clbits
+    for gatejson, row in cells:
+        gate = gatejson["type"]
+        info = gateinfo.get(gate)
+        if info is not None and info.builder is not None:
+            params = gatejson.get("params", [])
+            operation = gateOperation(info, params) if cache else info.builder(params)
+            qargs = [qubits[item] for item in gatejson["control"]] if info.controlled else []
+            qargs.append(qubits[row])
+            cargs = []
+            if gate == "m":
+                cargs.append(clbits[row])
+                if not gatejson.get("nowarning", False):
+                    warnings.warn("Circuit adding a measure gate. This might be redundand and could interfere with statevector validation.")
+            qc._append(operation, qargs, cargs)
+        elif info is not None and info.synthesizer is not None:
+            targets = list(gatejson["control"]) + [row]
+            for operation, positions in decomposition(info, gatejson["params"], len(gatejson["control"])):
+                qc._append(operation, [qubits[targets[p]] for p in positions], [])
+        elif gate not in placeholdergates:
+            warnings.warn("Gate <" + str(gate) + "> not yet implemented.")
+            raise InternalCommandException
 
+def createGate(qc: QuantumCircuit, gatejson: dict, row: int, col:int, rowcount:int):
     control = gatejson.get("control", [])
 
     for item in control:
@@ -80,93 +165,11 @@ def createGate(qc: QuantumCircuit, gatejson: dict, row: int, col:int, rowcount:i
             warnings.warn("Gate at (" + str(row) + "," + str(col) + ") requesting invalid control.")
             raise InternalCommandException
 
-    rparams = gatejson.get("params", [])
-    params = []
-    for param in rparams:
-        params.append(radians(param))
-
-    if gate == "empty":
-        pass
-    elif gate == "multi":
-        pass
-    elif gate == "barrier":
-        qc.barrier(row)
-    elif gate == "reset":
-        qc.reset(row)
-    elif gate == "m":
-        qc.measure(row,row)
-        if not gatejson.get("nowarning", False):
-            warnings.warn("Circuit adding a measure gate. This might be redundand and could interfere with statevector validation.")
-    elif gate == "i":
-        qc.i(row)
-
-    elif gate == "h":
-        qc.h(row)
-    elif gate == "ch":
-        qc.ch(control[0], row)
-
-    elif gate == "x":
-        qc.x(row)
-    elif gate == "y":
-        qc.y(row)
-    elif gate == "z":
-        qc.z(row)
-
-    elif gate == "rx":
-        qc.rx(params[0], row)
-    elif gate == "ry":
-        qc.ry(params[0], row)
-    elif gate == "rz":
-        qc.rz(params[0], row)
-
-    elif gate == "cx":
-        qc.cx(control[0], row)
-    elif gate == "cy":
-        qc.cy(control[0], row)
-    elif gate == "cz":
-        qc.cz(control[0], row)
-
-    elif gate == "crx":
-        qc.crx(params[0], control[0], row)
-    elif gate == "cry":
-        qc.cry(params[0], control[0], row)
-    elif gate == "crz":
-        qc.crz(params[0], control[0], row)
-
-    elif gate == "ccx":
-        qc.ccx(control[0], control[1], row)
-    elif gate == "mcrx":
-        qc.mcrx(params[0], control, row)
-    elif gate == "mcry":
-        qc.mcry(params[0], control, row)
-    elif gate == "mcrz":
-        qc.mcrz(params[0], control, row)
-
-    elif gate == "u":
-        qc.u(params[0], params[1], params[2], row)
-    elif gate == "cu":
-        qc.cu(params[0], params[1], params[2], 0, control[0], row)
-
-    elif gate == "swap":
-        qc.swap(control[0], row)
-    elif gate == "cswap":
-        qc.cswap(control[0], control[1], row)
-
-    elif gate == "puzzle":
-        qc.i(row)
-
-
-    else:
-        warnings.warn("Gate <" + str(gate) + "> not yet implemented.")
-        raise InternalCommandException
+    appendGates(qc, [(gatejson, row)])
 
 def updateGate(gatejson):
     """Updates gate in place based on param amount + control amount. Returns gatejson"""
     t = gatejson["type"]
-    if t in ["swap", "cswap", "barrier", "reset", "multi", "m", "i", "puzzle"]:
-        warnings.warn("Error updating gate type: " + str(t))
-        raise InternalCommandException
-
     if t == "empty":
         if "control" in gatejson:
             gatejson["control"] = []
@@ -174,35 +177,12 @@ def updateGate(gatejson):
             gatejson["params"] = []
         return gatejson
 
+    info = gateinfo.get(t)
+    if info is None or info.family is None:
+        warnings.warn("Error updating gate type: " + str(t))
+        raise InternalCommandException
+
     control = gatejson.get("control", [])
     params = gatejson.get("params", [])
-
-    if "u" in t:
-        if len(control) == 1:
-            gatejson["type"] = "cu"
-        else:
-            gatejson["type"] = "u"
-
-    elif "h" in t:
-        if len(control) == 1:
-            gatejson["type"] = "ch"
-        else:
-            gatejson["type"] = "h"
-
-    elif len(params) == 0 and "x" in t and len(control) == 2:
-        gatejson["type"] = "ccx"
-
-    else:
-        t = t[-1]
-        if t not in "x, y, z":
-            warnings.warn("Error updating gate type: " + str(t))
-            raise InternalCommandException
-
-        if len(params) > 0:
-            t = "r" + t
-        if len(control) == 1:
-            t = "c" + t
-        if len(control) > 1:
-            t = "mc" + t
-        gatejson["type"] = t
-    return gatejson
\ No newline at end of file
+    gatejson["type"] = variantName(info.family, len(control), len(params) > 0)
+    return gatejson
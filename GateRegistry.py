@@ -0,0 +1,153 @@
+import numpy as np
+from math import radians, cos, sin
+from cmath import exp
+from CircuitCache import gatecache
+
+#Every fact about a gate type lives in one GateInfo, looked up by type in gateinfo.
+#Validation, assembly, updateGate, the native simulator and the renderer all read from here, so a new gate is added
+#with one registerGate call (plus a builder in GateAssembler and a style in resources/gategraphics.json).
+#Only numpy is needed, qiskit builders and pygame styles are attached by the modules that own them.
+
+hmatrix = np.array([[1, 1], [1, -1]], dtype=complex) / np.sqrt(2)
+paulimatrices = {"x": np.array([[0, 1], [1, 0]], dtype=complex),
+                 "y": np.array([[0, -1j], [1j, 0]], dtype=complex),
+                 "z": np.array([[1, 0], [0, -1]], dtype=complex)}
+
+def rotationMatrix(axis, theta):
+    """Returns rx, ry or rz for theta in radians."""
+    c = cos(theta / 2)
+    s = sin(theta / 2)
+    if axis == "x":
+        return np.array([[c, -1j * s], [-1j * s, c]], dtype=complex)
+    elif axis == "y":
+        return np.array([[c, -s], [s, c]], dtype=complex)
+    else:
+        return np.array([[exp(-0.5j * theta), 0], [0, exp(0.5j * theta)]], dtype=complex)
+
+def uMatrix(theta, phi, lam):
+    return np.array([[cos(theta / 2), -exp(1j * lam) * sin(theta / 2)],
+                     [exp(1j * phi) * sin(theta / 2), exp(1j * (phi + lam)) * cos(theta / 2)]], dtype=complex)
+
+class GateInfo:
+    """Facts about one gate type. controls is the exact control count (multicontrol gates take one or more),
+    params the param count, family the base gate updateGate builds variants of (None if the type is fixed) and
+    matrix a function of the json params (degrees) returning the 2x2 matrix applied to the target row."""
+    __slots__ = ("name", "controls", "multicontrol", "params", "family", "matrix", "style", "builder", "synthesizer")
+
+    def __init__(self, name, controls=0, multicontrol=False, params=0, family=None, matrix=None):
+        self.name = name
+        self.controls = controls
+        self.multicontrol = multicontrol
+        self.params = params
+        self.family = family
+        self.matrix = matrix
+        self.style = None #gategraphics group, set by RenderBackend
+        self.builder = None #qiskit operation from the json params, set by GateAssembler
+        self.synthesizer = None #QuantumCircuit method for gates qiskit synthesizes, set by GateAssembler
+
+    @property
+    def arity(self):
+        """Rows the gate acts on, or None for multicontrol gates."""
+        if self.multicontrol:
+            return None
+        return self.controls + 1
+
+    @property
+    def controlled(self):
+        return self.controls > 0 or self.multicontrol
+
+gateinfo = {}
+
+#ordered lists kept for callers that iterate over gates, membership checks should use gateinfo
+validgates = []
+singleparamgates = []
+tripleparamsgates = []
+controlgates = []
+doublecontrolgates = []
+multicontrolgates = []
+
+placeholdergates = {"empty", "multi"}
+paramdigits = 6 #cached matrices and operations are keyed by params rounded like circuitHash rounds them
+
+def registerGate(name, controls=0, multicontrol=False, params=0, family=None, matrix=None):
+    info = GateInfo(name, controls, multicontrol, params, family, matrix)
+    gateinfo[name] = info
+    validgates.append(name)
+    if multicontrol:
+        multicontrolgates.append(name)
+    elif controls == 1:
+        controlgates.append(name)
+    elif controls == 2:
+        doublecontrolgates.append(name)
+    if params == 1:
+        singleparamgates.append(name)
+    elif params == 3:
+        tripleparamsgates.append(name)
+    return info
+
+def pauliMatrix(axis):
+    return lambda params: paulimatrices[axis]
+
+def rotationFunction(axis):
+    return lambda params: rotationMatrix(axis, radians(params[0]))
+
+for p in ["x", "y", "z"]:
+    registerGate(p, family=p, matrix=pauliMatrix(p))
+    registerGate("c" + p, controls=1, family=p, matrix=pauliMatrix(p))
+    registerGate("r" + p, params=1, family=p, matrix=rotationFunction(p))
+    registerGate("cr" + p, controls=1, params=1, family=p, matrix=rotationFunction(p))
+    registerGate("mcr" + p, multicontrol=True, params=1, family=p, matrix=rotationFunction(p))
+
+umatrix = lambda params: uMatrix(radians(params[0]), radians(params[1]), radians(params[2]))
+registerGate("u", params=3, family="u", matrix=umatrix)
+registerGate("cu", controls=1, params=3, family="u", matrix=umatrix)
+registerGate("ccx", controls=2, family="x", matrix=pauliMatrix("x"))
+registerGate("h", family="h", matrix=lambda params: hmatrix)
+registerGate("ch", controls=1, family="h", matrix=lambda params: hmatrix)
+registerGate("i")
+registerGate("swap", controls=1)
+registerGate("cswap", controls=2)
+for gate in ["barrier", "reset", "empty", "multi", "m", "puzzle"]:
+    registerGate(gate)
+
+def variantName(family, controlcount, hasparams):
+    """Gate type of <family> with the given controls and params, as updateGate picks it."""
+    if family in ["u", "h"]:
+        return "c" + family if controlcount == 1 else family
+    if family == "x" and not hasparams and controlcount == 2:
+        return "ccx"
+    name = family
+    if hasparams:
+        name = "r" + name
+    if controlcount == 1:
+        name = "c" + name
+    if controlcount > 1:
+        name = "mc" + name
+    return name
+
+def registerStyles(gategraphics):
+    """Attaches each gategraphics group to the gates it lists."""
+    for group in gategraphics:
+        for gate in group["group"]:
+            if gate in gateinfo:
+                gateinfo[gate].style = group
+
+def roundedParams(params):
+    return [round(float(p), paramdigits) for p in params]
+
+def gateKey(kind, gate, params, controlcount=0):
+    """gatecache key: what is cached, gate type, rounded params and control count."""
+    return (kind, gate, tuple(roundedParams(params)), controlcount)
+
+def gateUnitary(gate, params):
+    """gateinfo[gate].matrix(params), cached for gates with params. The matrix is shared, so it is read only."""
+    info = gateinfo[gate]
+    if info.params == 0:
+        return info.matrix(params)
+    key = gateKey("matrix", gate, params)
+    matrix = gatecache.get(key)
+    if matrix is None:
+        matrix = info.matrix(roundedParams(params))
+        matrix.setflags(write=False)
+        gatecache.put(key, matrix)
+    return matrix
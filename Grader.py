@@ -0,0 +1,84 @@
+import json
+import os
+import time
+import warnings
+import numpy as np
+from multiprocessing import get_context
+from errors import InternalCommandException
+from StatevectorSimulator import SimulationResult
+from GradingWorker import initWorker, gradeOne
+
+#Batch grading of saved circuits against a puzzle set.
+#Submissions live in <submissiondir>/<student>/<puzzle>.json. Targets are computed (or read from the pack / target cache)
+#once in the parent and handed to every worker when the pool starts, so workers only simulate the submissions.
+#Workers are always spawned (the default on Windows and macOS), so they behave the same everywhere and never inherit
+#the parent's pygame window or IBMQ thread.
+
+def loadTargets(setname):
+    """Returns {puzzle: (puzzlejson, target)} for every puzzle in a set, using the puzzle pack when it is up to date."""
+    import Puzzle #pygame is only needed by the parent, never by the workers
+
+    rawset = Puzzle.readPuzzleFile(setname)
+    packed = Puzzle.loadPuzzlePack(setname, Puzzle.puzzleHash(rawset))
+    if packed is None:
+        packed = []
+        for puzzle in json.loads(rawset):
+            puzzlejson, validator = Puzzle.preparePuzzle(puzzle)
+            packed.append((puzzle, puzzlejson, validator))
+
+    targets = {}
+    for puzzle, puzzlejson, validator in packed:
+        #memory mapped pack arrays can't be pickled, so they are copied before going to the workers
+        statevector = validator.target.statevector
+        if statevector is not None:
+            statevector = np.array(statevector)
+        target = SimulationResult(statevector, {}, np.array(validator.target.probabilities))
+        targets[puzzle] = (puzzlejson, target)
+    return targets
+
+def findSubmissions(submissiondir):
+    submissions = []
+    for student in sorted(os.listdir(submissiondir)):
+        studentdir = os.path.join(submissiondir, student)
+        if not os.path.isdir(studentdir):
+            continue
+        for fname in sorted(os.listdir(studentdir)):
+            if fname.endswith(".json"):
+                submissions.append((student, fname[:-len(".json")], os.path.join(studentdir, fname)))
+    return submissions
+
+def gradeSubmissions(setname, submissiondir, reportfile=None, processes=None):
+    """Grades every submission against a puzzle set across a process pool and writes a json report
+    (defaults to <submissiondir>/report.json). Returns the report."""
+    if not os.path.isdir(submissiondir):
+        warnings.warn("Submission directory <" + str(submissiondir) + "> not found.")
+        raise InternalCommandException
+    if reportfile is None:
+        reportfile = os.path.join(submissiondir, "report.json")
+
+    start = time.perf_counter()
+    targets = loadTargets(setname)
+    submissions = findSubmissions(submissiondir)
+    chunksize = max(1, len(submissions) // (4 * (processes or os.cpu_count() or 1)))
+    with get_context("spawn").Pool(processes, initializer=initWorker, initargs=(targets,)) as pool:
+        results = pool.map(gradeOne, submissions, chunksize)
+
+    students = {}
+    for result in results:
+        passed = students.setdefault(result["student"], [])
+        if result["passed"]:
+            passed.append(result["puzzle"])
+    report = {
+        "set": setname,
+        "submissions": len(results),
+        "passed": sum(1 for result in results if result["passed"]),
+        "errors": sum(1 for result in results if result["error"] is not None),
+        "seconds": time.perf_counter() - start,
+        "students": {student: {"passed": passed, "score": len(passed)} for student, passed in students.items()},
+        "results": results
+    }
+    with open(reportfile, "w") as f:
+        json.dump(report, f, indent=4)
+    print("Graded", report["submissions"], "submissions,", report["passed"], "passed, in",
+          round(report["seconds"], 2), "seconds. Report written to", reportfile)
+    return report
@@ -0,0 +1,38 @@
+import json
+import time
+import warnings
+from errors import InternalCommandException
+from CircuitJSONTools import validateJSON
+from PuzzleValidation import PuzzleValidator
+
+#Grading pool workers. Workers are spawned, so each one imports only this module (and main.py, whose startup is
+#guarded by __main__). Nothing here may import pygame or start the IBMQ account thread.
+
+workervalidators = {}
+
+def initWorker(targets):
+    workervalidators.clear()
+    for puzzle, (puzzlejson, target) in targets.items():
+        workervalidators[puzzle] = PuzzleValidator(puzzlejson, puzzlejson.get("tolerance", 0.1), target=target)
+
+def gradeOne(submission):
+    student, puzzle, path = submission
+    report = {"student": student, "puzzle": puzzle, "file": path, "passed": False, "error": None, "seconds": 0.0}
+    if puzzle not in workervalidators:
+        report["error"] = "Puzzle <" + puzzle + "> is not in the puzzle set."
+        return report
+
+    start = time.perf_counter()
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        try:
+            with open(path) as f:
+                circuitjson = json.load(f)
+            validateJSON(circuitjson)
+            report["passed"] = bool(workervalidators[puzzle].validate(circuitjson))
+        except InternalCommandException:
+            report["error"] = str(caught[-1].message) if len(caught) > 0 else "Invalid circuit."
+        except (Exception,) as e:
+            report["error"] = type(e).__name__ + ": " + str(e)
+    report["seconds"] = time.perf_counter() - start
+    return report
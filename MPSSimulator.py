@@ -0,0 +1,166 @@
+import numpy as np
+import warnings
+from errors import InternalCommandException
+from StatevectorSimulator import SimulationResult, applyGate, noopgates, stochasticCells
+from StabilizerSimulator import bitsToCounts
+
+#Matrix product state engine for wide circuits that are not clifford only.
+#Site i holds a tensor of shape (left bond, 2, right bond). Multi row gates first move their rows next to each other
+#with neighbour swaps, then the block is contracted, handed to the statevector engine and split back with SVDs.
+#Bond dimensions are capped at maxbond and the discarded weight is reported as the truncation error.
+#The state is kept in mixed canonical form around an orthogonality center that every contraction first moves into its
+#block, so the singular values a split drops are the true Schmidt coefficients of that bond.
+
+defaultmaxbond = 64
+cutoff = 1e-12
+
+class MPSResult(SimulationResult):
+    def __init__(self, counts, truncationerror, maxbondused):
+        super().__init__(None, counts)
+        self.truncationerror = truncationerror
+        self.maxbondused = maxbondused
+
+class MPS:
+    def __init__(self, rowcount, maxbond=defaultmaxbond):
+        self.n = rowcount
+        self.maxbond = maxbond
+        self.tensors = []
+        for _ in range(0, rowcount):
+            t = np.zeros((1, 2, 1), dtype=complex)
+            t[0, 0, 0] = 1
+            self.tensors.append(t)
+        self.sites = list(range(0, rowcount)) #sites[row] is where that row currently lives
+        self.rows = list(range(0, rowcount)) #rows[site] is the row living on that site
+        self.truncationerror = 0.0
+        self.maxbondused = 1
+        self.center = 0 #sites left of it are left canonical, sites right of it right canonical
+
+    def moveCenter(self, site):
+        """Moves the orthogonality center to site with QR steps."""
+        while self.center < site:
+            t = self.tensors[self.center]
+            left, _, right = t.shape
+            q, r = np.linalg.qr(t.reshape(left * 2, right))
+            self.tensors[self.center] = q.reshape(left, 2, -1)
+            self.tensors[self.center + 1] = np.tensordot(r, self.tensors[self.center + 1], axes=([1], [0]))
+            self.center += 1
+        while self.center > site:
+            t = self.tensors[self.center]
+            left, _, right = t.shape
+            q, r = np.linalg.qr(t.reshape(left, 2 * right).T)
+            self.tensors[self.center] = q.T.reshape(-1, 2, right)
+            self.tensors[self.center - 1] = np.tensordot(self.tensors[self.center - 1], r.T, axes=([-1], [0]))
+            self.center -= 1
+
+    def contract(self, start, stop):
+        """Contracts sites start..stop-1 into one tensor (left, 2, ..., 2, right). The orthogonality center is moved
+        to start first, so the block holds it and everything around the block is canonical."""
+        self.moveCenter(start)
+        block = self.tensors[start]
+        for i in range(start + 1, stop):
+            block = np.tensordot(block, self.tensors[i], axes=([-1], [0]))
+        return block
+
+    def split(self, block, start, stop):
+        """Splits a block from contract back into sites start..stop-1, truncating every new bond. The SVDs leave the
+        sites left canonical and carry the orthogonality center to stop - 1."""
+        for i in range(start, stop - 1):
+            left = block.shape[0]
+            matrix = block.reshape(left * 2, -1)
+            u, s, vh = np.linalg.svd(matrix, full_matrices=False)
+
+            keep = max(1, min(self.maxbond, int(np.sum(s > cutoff * s[0]))))
+            total = np.sum(s ** 2)
+            self.truncationerror += float(np.sum(s[keep:] ** 2) / total)
+            u, s, vh = u[:, :keep], s[:keep], vh[:keep]
+            s = s / np.sqrt(np.sum(s ** 2) / total)
+            self.maxbondused = max(self.maxbondused, keep)
+
+            self.tensors[i] = u.reshape(left, 2, keep)
+            block = (s[:, None] * vh).reshape((keep,) + block.shape[2:])
+        self.tensors[stop - 1] = block
+        self.center = stop - 1
+
+    def swapSites(self, site):
+        """Swaps the rows living on site and site + 1."""
+        block = self.contract(site, site + 2)
+        self.split(np.swapaxes(block, 1, 2), site, site + 2)
+        rowa, rowb = self.rows[site], self.rows[site + 1]
+        self.rows[site], self.rows[site + 1] = rowb, rowa
+        self.sites[rowa], self.sites[rowb] = site + 1, site
+
+    def gather(self, rows):
+        """Moves rows onto consecutive sites and returns the first site."""
+        order = sorted(rows, key=lambda r: self.sites[r])
+        start = self.sites[order[0]]
+        for offset, row in enumerate(order):
+            while self.sites[row] > start + offset:
+                self.swapSites(self.sites[row] - 1)
+        return start
+
+    def apply(self, gatejson, row):
+        gate = gatejson["type"]
+        if gate in noopgates or gate == "m":
+            return
+
+        rows = [row] + list(gatejson.get("control", []))
+        if len(rows) == 1:
+            site = self.sites[row]
+            self.tensors[site] = applyLocal(self.tensors[site], gatejson, row, [row])
+            return
+
+        start = self.gather(rows)
+        stop = start + len(rows)
+        block = self.contract(start, stop)
+        block = applyLocal(block, gatejson, row, self.rows[start:stop])
+        self.split(block, start, stop)
+
+    def rightCanonicalize(self):
+        self.moveCenter(0)
+        self.tensors[0] = self.tensors[0] / np.linalg.norm(self.tensors[0])
+
+    def sample(self, shots, rng):
+        """Returns a (shots, rows) bool array of measured bits."""
+        self.rightCanonicalize()
+        env = np.ones((shots, 1), dtype=complex)
+        bits = np.zeros((shots, self.n), dtype=bool)
+        for site in range(0, self.n):
+            v = np.einsum("sl,lbr->sbr", env, self.tensors[site])
+            weights = np.sum(np.abs(v) ** 2, axis=2)
+            p1 = weights[:, 1] / np.sum(weights, axis=1)
+            outcome = rng.random(shots) < p1
+            bits[:, self.rows[site]] = outcome
+            env = v[np.arange(shots), outcome.astype(int)]
+            env = env / np.linalg.norm(env, axis=1)[:, None]
+        return bits
+
+def applyLocal(block, gatejson, row, blockrows):
+    """Applies a gate to a contracted block holding blockrows on its physical axes, using the statevector engine."""
+    k = len(blockrows)
+    local = {r: i for i, r in enumerate(blockrows)}
+    localgate = dict(gatejson)
+    if "control" in gatejson:
+        localgate["control"] = [local[c] for c in gatejson["control"]]
+
+    #statevector engine wants row i on axis -(i + 1), so move the bonds to the front and reverse the physical axes
+    order = [0, k + 1] + list(range(k, 0, -1))
+    tensor = np.transpose(block, order).copy()
+    applyGate(tensor, localgate, local[row], k)
+    return np.transpose(tensor, np.argsort(order))
+
+def simulateJSON(circuitjson, shots=1000, maxbond=None, seed=None):
+    """Simulates circuit json as a matrix product state. The result has counts and a truncation error, no statevector."""
+    if maxbond is None:
+        maxbond = defaultmaxbond
+    if len(stochasticCells(circuitjson)) > 0:
+        warnings.warn("Matrix product state simulation does not support mid circuit measurements or resets.")
+        raise InternalCommandException
+
+    rows = circuitjson["rows"]
+    mps = MPS(len(rows), maxbond)
+    for x in range(0, len(rows[0]["gates"])):
+        for index, row in enumerate(rows):
+            mps.apply(row["gates"][x], index)
+
+    bits = mps.sample(shots, np.random.default_rng(seed))
+    return MPSResult(bitsToCounts(bits), mps.truncationerror, mps.maxbondused)
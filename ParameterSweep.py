@@ -0,0 +1,182 @@
+import itertools
+import warnings
+import numpy as np
+import matplotlib.pyplot as pyplot
+from errors import InternalCommandException
+from GateRegistry import gateinfo
+import StatevectorSimulator
+from StatevectorSimulator import fuseColumns, runOps, applyGate, controlIndex, subAxis, stochasticCells
+
+#Parameter sweeps on the native statevector engine. Every grid point is an entry on a leading batch axis of one
+#state, so the gates that don't depend on the swept angles are fused and applied once for the whole grid, and the
+#swept cells apply one 2x2 matrix per grid point in a single einsum.
+
+def parseTarget(text):
+    """"row,col" or "row,col,paramindex" -> (row, col, paramindex)."""
+    try:
+        parts = [int(part) for part in text.split(",")]
+    except ValueError:
+        parts = []
+    if len(parts) == 2:
+        parts.append(0)
+    if len(parts) != 3:
+        warnings.warn("Sweep target <" + text + "> should be row,col or row,col,paramindex.")
+        raise InternalCommandException
+    return tuple(parts)
+
+def parseRange(text):
+    """"start:stop:steps" in degrees -> the steps angles from start to stop, both included."""
+    parts = text.split(":")
+    try:
+        start, stop, steps = float(parts[0]), float(parts[1]), int(parts[2])
+    except (ValueError, IndexError):
+        start = stop = steps = None
+    if len(parts) != 3 or steps is None or not np.isfinite([start, stop]).all():
+        warnings.warn("Sweep range <" + text + "> should be start:stop:steps, with a whole number of steps.")
+        raise InternalCommandException
+    if steps < 1:
+        warnings.warn("Sweep range <" + text + "> needs at least one step.")
+        raise InternalCommandException
+    return np.linspace(start, stop, steps)
+
+def checkTargets(circuitjson, targets):
+    rows = circuitjson["rows"]
+    for row, col, paramindex in targets:
+        if row < 0 or row >= len(rows) or col < 0 or col >= len(rows[0]["gates"]):
+            warnings.warn("Sweep target (" + str(row) + "," + str(col) + ") is outside the circuit.")
+            raise InternalCommandException
+        gatejson = rows[row]["gates"][col]
+        info = gateinfo.get(gatejson["type"])
+        if info is None or info.params == 0 or info.matrix is None:
+            warnings.warn("Gate <" + gatejson["type"] + "> at (" + str(row) + "," + str(col) + ") has no angle to sweep.")
+            raise InternalCommandException
+        if paramindex < 0 or paramindex >= len(gatejson.get("params", [])):
+            warnings.warn("Gate at (" + str(row) + "," + str(col) + ") has no param " + str(paramindex) + ".")
+            raise InternalCommandException
+    if len(set(targets)) != len(targets):
+        warnings.warn("Sweep targets must be different params.")
+        raise InternalCommandException
+    if len(stochasticCells(circuitjson)) > 0:
+        warnings.warn("Sweeps don't support resets or mid circuit measurements.")
+        raise InternalCommandException
+    if len(rows) > StatevectorSimulator.maxstatevectorrows:
+        warnings.warn("Circuit is too wide for a sweep.")
+        raise InternalCommandException
+
+def sweptMatrices(gatejson, axes, targets, ranges):
+    """Matrix of a swept cell at every grid point, shape (points, 2, 2). Only the grid axes that sweep this cell
+    are evaluated, the rest is broadcast."""
+    info = gateinfo[gatejson["type"]]
+    grid = [len(values) for values in ranges]
+    matrices = []
+    for point in itertools.product(*[ranges[axis] for axis in axes]):
+        params = [float(p) for p in gatejson["params"]]
+        for axis, value in zip(axes, point):
+            params[targets[axis][2]] = float(value)
+        matrices.append(info.matrix(params))
+    shape = [grid[axis] if axis in axes else 1 for axis in range(0, len(grid))]
+    matrices = np.array(matrices).reshape(shape + [2, 2])
+    return np.broadcast_to(matrices, grid + [2, 2]).reshape(-1, 2, 2)
+
+def applyBatched(state, matrices, row, controls, rowcount):
+    """applyMatrix with a different matrix for every entry of the leading batch axis."""
+    idx = controlIndex(controls, rowcount)
+    axis = subAxis(row, controls)
+    sub = np.moveaxis(state[idx], axis, -1)
+    state[idx] = np.moveaxis(np.einsum("bij,b...j->b...i", matrices, sub), -1, axis)
+
+def sweepPlan(circuitjson, targets, ranges):
+    """Fused ops between the swept columns, and per swept column the swept cells with their matrices."""
+    rows = circuitjson["rows"]
+    cells = {}
+    for axis, (row, col, _) in enumerate(targets):
+        cells.setdefault((col, row), []).append(axis)
+    plan = []
+    start = 0
+    for col in sorted(set(col for col, _ in cells)):
+        plan.append(("ops", fuseColumns(circuitjson, start, col)))
+        swept = {row: sweptMatrices(rows[row]["gates"][col], axes, targets, ranges)
+                 for (c, row), axes in cells.items() if c == col}
+        plan.append(("column", col, swept))
+        start = col + 1
+    plan.append(("ops", fuseColumns(circuitjson, start, len(rows[0]["gates"]))))
+    return plan
+
+def sweep(circuitjson, targets, ranges, maxbytes=256 * 2 ** 20):
+    """Outcome probabilities of circuitjson with the (row, col, paramindex) targets set to every combination of
+    their ranges (degrees). Returns an array of shape [len(r) for r in ranges] + [2 ** rowcount], the last axis
+    indexed like the statevector. The grid runs in batches of at most maxbytes of state."""
+    checkTargets(circuitjson, targets)
+    rows = circuitjson["rows"]
+    rowcount = len(rows)
+    grid = [len(values) for values in ranges]
+    points = int(np.prod(grid))
+    plan = sweepPlan(circuitjson, targets, ranges)
+
+    batch = max(1, maxbytes // (16 * 2 ** rowcount))
+    probabilities = np.empty((points, 2 ** rowcount))
+    for first in range(0, points, batch):
+        last = min(points, first + batch)
+        state = np.zeros((last - first,) + (2,) * rowcount, dtype=complex)
+        state[(slice(None),) + (0,) * rowcount] = 1
+        for step in plan:
+            if step[0] == "ops":
+                runOps(state, step[1], rowcount)
+                continue
+            col, swept = step[1], step[2]
+            for index, row in enumerate(rows):
+                gatejson = row["gates"][col]
+                if index in swept:
+                    applyBatched(state, swept[index][first:last], index, gatejson.get("control", []), rowcount)
+                else:
+                    applyGate(state, gatejson, index, rowcount)
+        probabilities[first:last] = np.abs(state.reshape(last - first, -1)) ** 2
+    return probabilities.reshape(grid + [2 ** rowcount])
+
+def plotSweep(landscape, targets, ranges, mincutoff=0.05, maxplots=16):
+    """Plots every outcome that reaches mincutoff somewhere on the grid, as curves for one target or as one
+    heatmap per outcome for two."""
+    rowcount = int(np.log2(landscape.shape[-1]))
+    peaks = landscape.reshape(-1, landscape.shape[-1]).max(axis=0)
+    outcomes = [o for o in np.argsort(-peaks) if peaks[o] >= mincutoff][0:maxplots]
+    if len(outcomes) == 0:
+        outcomes = [int(np.argmax(peaks))]
+    labels = [str(row) + "," + str(col) + " param " + str(paramindex) + " (deg)" for row, col, paramindex in targets]
+
+    if len(targets) == 1:
+        fig, ax = pyplot.subplots()
+        for o in sorted(outcomes):
+            ax.plot(ranges[0], landscape[:, o], label=format(int(o), "0" + str(rowcount) + "b"))
+        ax.set_xlabel(labels[0])
+        ax.set_ylabel("Probability")
+        ax.legend()
+    else:
+        size = int(np.ceil(np.sqrt(len(outcomes))))
+        fig, axes = pyplot.subplots(size, size, squeeze=False)
+        extent = [ranges[1][0], ranges[1][-1], ranges[0][-1], ranges[0][0]]
+        for ax, o in zip(axes.flat, sorted(outcomes)):
+            image = ax.imshow(landscape[:, :, o], extent=extent, aspect="auto", vmin=0, vmax=1)
+            ax.set_title(format(int(o), "0" + str(rowcount) + "b"))
+        for ax in list(axes.flat)[len(outcomes):]:
+            ax.axis("off")
+        fig.supxlabel(labels[1])
+        fig.supylabel(labels[0])
+        fig.colorbar(image, ax=axes.ravel().tolist())
+    pyplot.show()
+
+def sweepFile(circuitjson, fname, params, plot=False):
+    """Runs the sweep command on circuit file <fname>. params are target, range pairs for one or two targets,
+    optionally followed by the output name. The landscape is saved to circuits/<name>.npy."""
+    if len(params) < 2 or len(params) > 5:
+        warnings.warn("Sweep needs a target and range for one or two params, optionally followed by an output name.")
+        raise InternalCommandException
+    pairs = params[0:4] if len(params) >= 4 else params[0:2]
+    outname = params[-1] if len(params) in [3, 5] else fname + "_sweep"
+    targets = [parseTarget(text) for text in pairs[0::2]]
+    ranges = [parseRange(text) for text in pairs[1::2]]
+    landscape = sweep(circuitjson, targets, ranges)
+    np.save("circuits/" + outname + ".npy", landscape)
+    print("Saved probability landscape", landscape.shape, "to circuits/" + outname + ".npy")
+    if plot:
+        plotSweep(landscape, targets, ranges)
+    return landscape
@@ -0,0 +1,99 @@
+from qiskit import QuantumCircuit
+from qiskit.circuit import ParameterVector
+import hashlib
+import json
+from GateAssembler import appendGates
+from GateRegistry import gateinfo, placeholdergates, roundedParams
+from CircuitCache import templatecache
+
+#Circuits compiled once with a qiskit Parameter standing in for every param of every parametric cell.
+#Editing an angle doesn't change the template, so the next run only binds the new values instead of assembling and
+#transpiling the whole circuit again. Multi controlled rotations are synthesized by qiskit from their angle, so their
+#params stay part of the template.
+
+def isSymbolic(gatejson):
+    """True if the params of the cell are bound at run time instead of being built into the template."""
+    info = gateinfo.get(gatejson["type"])
+    return info is not None and info.params > 0 and info.builder is not None
+
+def templateKey(circuitjson):
+    """Like circuitHash, but only the param count of symbolic cells is hashed, so circuits that differ only in those
+    params share a key."""
+    rows = []
+    for row in circuitjson["rows"]:
+        cells = []
+        for gatejson in row["gates"]:
+            cell = [gatejson["type"]]
+            if len(gatejson.get("control", [])) > 0:
+                cell.append(list(gatejson["control"]))
+            params = gatejson.get("params", [])
+            if isSymbolic(gatejson):
+                cell.append(len(params))
+            elif len(params) > 0:
+                cell.append(roundedParams(params))
+            cells.append(cell)
+        rows.append(cells)
+    data = json.dumps(rows, separators=(",", ":"))
+    return hashlib.sha1(data.encode()).hexdigest()
+
+class ParametricCircuit:
+    """Circuit json assembled with symbolic params. cells lists (row, col) of every symbolic cell in column order,
+    their params are parameters[offsets[i]:offsets[i] + counts[i]]. compiled holds the transpiled template and is
+    set by whoever runs it."""
+    __slots__ = ("cells", "offsets", "counts", "parameters", "circuit", "compiled")
+
+    def __init__(self, circuitjson):
+        rows = circuitjson["rows"]
+        depth = len(rows[0]["gates"])
+        self.cells = []
+        self.offsets = []
+        self.counts = []
+        symbolic = []
+        total = 0
+        for col in range(0, depth):
+            for index, row in enumerate(rows):
+                gatejson = row["gates"][col]
+                if gatejson["type"] not in placeholdergates and isSymbolic(gatejson):
+                    self.cells.append((index, col))
+                    self.offsets.append(total)
+                    self.counts.append(len(gatejson["params"]))
+                    total += len(gatejson["params"])
+                    symbolic.append(gatejson)
+        self.parameters = ParameterVector("params", total)
+
+        #symbolic cells get a copy of their json with Parameters in place of the values
+        stand = {id(gatejson): dict(gatejson, params=self.parameters[offset:offset + count])
+                 for gatejson, offset, count in zip(symbolic, self.offsets, self.counts)}
+        self.circuit = QuantumCircuit(len(rows), len(rows))
+        columns = zip(*[row["gates"] for row in rows])
+        appendGates(self.circuit, [(stand.get(id(gatejson), gatejson), index) for column in columns
+                                   for index, gatejson in enumerate(column)
+                                   if gatejson["type"] not in placeholdergates], cache=False)
+        self.compiled = None
+
+    def values(self, circuitjson):
+        """The params of the symbolic cells of circuitjson (degrees), in parameters order."""
+        rows = circuitjson["rows"]
+        values = []
+        for row, col in self.cells:
+            values.extend(float(p) for p in rows[row]["gates"][col]["params"])
+        return values
+
+    def bind(self, circuit, circuitjson):
+        """Copy of circuit (the template or its compiled form) with the params of circuitjson assigned."""
+        if len(self.parameters) == 0:
+            return circuit.copy()
+        return circuit.assign_parameters({self.parameters: self.values(circuitjson)})
+
+def parametricCircuit(circuitjson):
+    """The ParametricCircuit of circuitjson, built once per templateKey."""
+    key = templateKey(circuitjson)
+    template = templatecache.get(key)
+    if template is None:
+        template = templatecache.put(key, ParametricCircuit(circuitjson))
+    return template
+
+def boundCircuit(circuitjson):
+    """QuantumCircuit of circuitjson, bound from its template instead of being assembled."""
+    template = parametricCircuit(circuitjson)
+    return template.bind(template.circuit, circuitjson)
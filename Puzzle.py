@@ -2,9 +2,14 @@ import json
 import CircuitFileRenderer as CFR
 import PygameTools
 from errors import InternalCommandException
-from CircuitJSONTools import validateJSON, assembleCircuit, saveJSON
-from QCircuitSimulator import simulate
-from qiskit.quantum_info import Statevector
+from CircuitJSONTools import validateJSON, saveJSON
+from StatevectorSimulator import SimulationResult, exactJSON
+from PuzzleValidation import PuzzleValidator, puzzleHash
+from PuzzleSolver import solvePuzzle, hint, describeMove, defaultmaxdepth, interactivemaxstates, interactivemaxseconds
+import numpy as np
+import mmap
+import os
+import threading
 import warnings
 import pygame
 
@@ -35,69 +40,152 @@ def validatePuzzle(puzzlejson):
         warnings.warn("Puzzle row count not in valid range!")
         raise InternalCommandException
 
-#region internal validators
-def validateStatevector(circuita, circuitb, tolerance):
-    if tolerance == tolerance:
-        pass
-    a = simulate(circuita)
-    b = simulate(circuitb)
-
-    sa = Statevector(a.get_statevector(circuita))
-    sb = Statevector(b.get_statevector(circuitb))
-    return sa.equiv(sb)
-
-def validateResults(circuita, circuitb, tolerance):
-    a = simulate(circuita)
-    b = simulate(circuitb)
-
-    da = a.get_counts(circuita)
-    db = b.get_counts(circuitb)
-
-    for key, valuea in da.items():
-        valueb = db.get(key, 0)
-        if abs(valuea - valueb) > tolerance * 1000: #number of shots
-            return False
-
-    for key, valueb in db.items():
-        valuea = da.get(key, 0)
-        if abs(valuea - valueb) > tolerance * 1000: #number of shots
-            return False
-
-    return True
-
-def validateNone(circuita, circuitb, tolerance):
-    if circuita == circuitb or tolerance == tolerance:
-        pass
-    warnings.warn("Validation none error case triggered!")
-    raise InternalCommandException
-
-class PuzzleValidator:
-    def __init__(self, puzzlejson, tolerance):
-        self.correctcircuitjson = puzzlejson["validation-circuit"]
-        self.validationMode = puzzlejson["validation-mode"]
-        self.validationFunction = validateNone
-        self.tolerance = tolerance
-        if puzzlejson["validation-mode"] == "statevector":
-            self.validationFunction = validateStatevector
-        elif puzzlejson["validation-mode"] == "results":
-            self.validationFunction = validateResults
-
-    def validate(self, circuit):
-        return self.validationFunction(circuit, assembleCircuit(self.correctcircuitjson), self.tolerance)
-#endregion
 
-def loadPuzzle(fname, screen=None):
+#region puzzle packs
+#A pack is one file holding every puzzle of a set, already validated, with its exact target:
+#magic, 8 byte header length, json header, then the raw target arrays (16 byte aligned) which are memory mapped.
+#The header keeps the size, mtime and hash of every puzzle file, so loading only hashes the files whose stat changed.
+packmagic = b"QEPACK1\n"
+
+def readPuzzleFile(fname):
     try:
-        with open("puzzles/" + fname + ".json") as f:
-            puzzlejson = json.load(f)
+        with open("puzzles/" + fname + ".json", "rb") as f:
+            return f.read()
     except FileNotFoundError:
-        warnings.warn("Puzzle file not found.")
+        warnings.warn("Puzzle <" + str(fname) + "> file not found.")
         raise InternalCommandException
 
+def buildPuzzlePack(fname):
+    """Validates every puzzle in a puzzle set once and writes puzzles/<fname>.pack."""
+    rawset = readPuzzleFile(fname)
+    entries = []
+    arrays = []
+    offset = 0
+    for puzzle in json.loads(rawset):
+        stat = puzzleStat(puzzle) #before the read, so an edit in between shows up as a stat change
+        rawpuzzle = readPuzzleFile(puzzle)
+        puzzlejson = json.loads(rawpuzzle)
+        validatePuzzle(puzzlejson)
+        target = exactJSON(puzzlejson["validation-circuit"])
+
+        entry = {"name": puzzle, "stat": stat, "hash": puzzleHash(rawpuzzle), "puzzle": puzzlejson,
+                 "statevector": None}
+        for key, array in [("statevector", target.statevector), ("probabilities", target.probabilities)]:
+            if array is not None:
+                entry[key] = [offset, str(array.dtype), len(array)]
+                arrays.append(array)
+                offset += array.nbytes
+        entries.append(entry)
+
+    header = json.dumps({"set": puzzleHash(rawset), "puzzles": entries}).encode()
+    header += b" " * (-(len(packmagic) + 8 + len(header)) % 16)
+    with open("puzzles/" + fname + ".pack", "wb") as f:
+        f.write(packmagic)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for array in arrays:
+            f.write(np.ascontiguousarray(array).tobytes())
+    print("Built puzzle pack with", len(entries), "puzzles.")
+
+def puzzleStat(fname):
+    """[size, mtime in ns] of a puzzle file, or None when it is missing."""
+    try:
+        stat = os.stat("puzzles/" + fname + ".json")
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+def packedPuzzleCurrent(entry):
+    """If the puzzle file of a pack entry is unchanged since the pack was built. The file is only read and hashed
+    when its size or mtime differ from the ones in the pack."""
+    stat = puzzleStat(entry["name"])
+    if stat is None:
+        return False
+    if stat == entry.get("stat"):
+        return True
+    try:
+        with open("puzzles/" + entry["name"] + ".json", "rb") as f:
+            return puzzleHash(f.read()) == entry.get("hash") #packs from before per puzzle hashes count as stale
+    except FileNotFoundError:
+        return False
+
+def loadPuzzlePack(fname, sethash=None):
+    """Returns [(name, puzzlejson, PuzzleValidator)] from puzzles/<fname>.pack, or None when there is no pack.
+    Passing the hash of the puzzle set file also returns None when the pack was built from a different set file or
+    any of its puzzle files changed since. The targets are copied out of the map, so the pack is closed again
+    before this returns and can be rebuilt while the set is played."""
+    try:
+        f = open("puzzles/" + fname + ".pack", "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        headerstart = len(packmagic) + 8
+        start = f.read(headerstart)
+        if len(start) != headerstart or start[0:len(packmagic)] != packmagic:
+            warnings.warn("Puzzle pack <" + str(fname) + "> is malformed.")
+            raise InternalCommandException
+        headerlen = int.from_bytes(start[len(packmagic):], "little")
+        header = json.loads(f.read(headerlen))
+        if sethash is not None and header["set"] != sethash:
+            return None
+        if sethash is not None and not all(packedPuzzleCurrent(entry) for entry in header["puzzles"]):
+            return None
+
+        arraystart = headerstart + headerlen
+        puzzles = []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for entry in header["puzzles"]:
+                arrays = {}
+                for key in ["statevector", "probabilities"]:
+                    if entry[key] is not None:
+                        offset, dtype, length = entry[key]
+                        arrays[key] = np.frombuffer(data, dtype, length, arraystart + offset).copy()
+                target = SimulationResult(arrays.get("statevector"), {}, arrays["probabilities"])
+                puzzlejson = entry["puzzle"]
+                validator = PuzzleValidator(puzzlejson, puzzlejson.get("tolerance", 0.1), target=target)
+                puzzles.append((entry["name"], puzzlejson, validator))
+    return puzzles
+#endregion
+
+def preparePuzzle(fname):
+    """Reads and validates a puzzle file. Returns (puzzlejson, validator)."""
+    rawpuzzle = readPuzzleFile(fname)
+    puzzlejson = json.loads(rawpuzzle)
+
     validatePuzzle(puzzlejson)
+    validator = PuzzleValidator(puzzlejson, puzzlejson.get("tolerance", 0.1), puzzleHash(rawpuzzle))
+    return puzzlejson, validator
+
+class PuzzlePrefetcher:
+    """Reads, validates and computes the target of a puzzle on a background thread."""
+    def __init__(self, fname):
+        self.fname = fname
+        self.prepared = None
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.prepared = preparePuzzle(self.fname)
+        except InternalCommandException as e:
+            self.error = e
+
+    def get(self):
+        """Waits for the puzzle (normally already done) and returns (puzzlejson, validator)."""
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.prepared
+
+def loadPuzzle(fname, screen=None, prepared=None):
+    """Plays a puzzle. prepared can hold an already validated (puzzlejson, validator) pair."""
+    if prepared is None:
+        prepared = preparePuzzle(fname)
+    puzzlejson, validator = prepared
 
     save, circuitjson = CFR.editor(puzzlejson["circuit"], title=puzzlejson["name"], ispuzzle=True,
-                                   validator=PuzzleValidator(puzzlejson, puzzlejson.get("tolerance", 0.1)),
+                                   validator=validator,
                                    gates=puzzlejson["unlocked-gates"], minrows=puzzlejson["minrows"],
                                    maxrows=puzzlejson["maxrows"],
                                    allowcontrol=puzzlejson["allowcontrol"], allowparams=puzzlejson["allowparams"],
@@ -109,25 +197,69 @@ def loadPuzzle(fname, screen=None):
 
 def loadPuzzleset(fname):
     try:
-        with open("puzzles/" + fname + ".json") as f:
-            puzzleset = json.load(f)
+        with open("puzzles/" + fname + ".json", "rb") as f:
+            rawset = f.read()
     except FileNotFoundError:
         warnings.warn("Puzzle set file not found.")
         raise InternalCommandException
-
-    for puzzle in puzzleset:
-        try:
-            with open("puzzles/" + puzzle + ".json") as f:
-                f.readlines()
-        except FileNotFoundError:
-            warnings.warn("Puzzle <" + str(puzzle) + "> file not found.")
-            raise InternalCommandException
+    puzzleset = json.loads(rawset)
+
+    packed = loadPuzzlePack(fname, puzzleHash(rawset))
+    if packed is None:
+        print("No up to date puzzle pack found, run buildpack to speed up loading.")
+        for puzzle in puzzleset:
+            try:
+                with open("puzzles/" + puzzle + ".json") as f:
+                    f.readlines()
+            except FileNotFoundError:
+                warnings.warn("Puzzle <" + str(puzzle) + "> file not found.")
+                raise InternalCommandException
 
     screen = PygameTools.createPygameWindow()
-    for puzzle in puzzleset:
-        loadPuzzle(puzzle, screen=screen)
+    if packed is None:
+        #puzzle N + 1 is prepared in the background while puzzle N is played
+        prefetcher = PuzzlePrefetcher(puzzleset[0])
+        for index, puzzle in enumerate(puzzleset):
+            prepared = prefetcher.get()
+            if index + 1 < len(puzzleset):
+                prefetcher = PuzzlePrefetcher(puzzleset[index + 1])
+            loadPuzzle(puzzle, screen=screen, prepared=prepared)
+    else:
+        for puzzle, puzzlejson, validator in packed:
+            loadPuzzle(puzzle, screen=screen, prepared=(puzzlejson, validator))
     pygame.display.quit()
 
+def printSolution(moves, finished, maxdepth):
+    if moves is None and not finished:
+        print("Solvability unknown: the search ran out of its budget before finding a solution.")
+    elif moves is None:
+        print("No solution with up to", maxdepth, "gates was found using the unlocked gates.")
+    else:
+        print("Shortest solution uses", len(moves), "gates:")
+        for move in moves:
+            print("   ", describeMove(move))
+
+def checkSolvable(puzzlejson):
+    """Tells the puzzle author how many gates the shortest solution needs, on a budget short enough to wait for."""
+    moves, finished = solvePuzzle(puzzlejson, maxstates=interactivemaxstates, maxseconds=interactivemaxseconds)
+    printSolution(moves, finished, defaultmaxdepth)
+
+def solve(fname, hintonly=False, maxdepth=defaultmaxdepth):
+    """Prints the shortest solution of a puzzle, or only the first gate to add to its starting circuit."""
+    puzzlejson, validator = preparePuzzle(fname)
+    if hintonly:
+        move, finished = hint(puzzlejson, puzzlejson["circuit"], validator, maxdepth)
+        if move is not None:
+            print("Hint: add", describeMove(move))
+        elif finished:
+            print("No hint found.")
+        else:
+            print("No hint found before the search ran out of its budget.")
+        return
+
+    moves, finished = solvePuzzle(puzzlejson, validator, maxdepth=maxdepth)
+    printSolution(moves, finished, maxdepth)
+
 def editPuzzle(fname):
     try:
         with open("puzzles/" + fname + ".json") as f:
@@ -206,8 +338,15 @@ def editPuzzle(fname):
             ("tolerance" not in puzzle or input("Puzzle validation tolerance is: " + str(puzzle["tolerance"])  + " | Change? ") == "y")):
         puzzle["tolerance"] = float(input("Enter puzzle validation tolerance: "))
 
+    if (puzzle["validation-mode"] == "results" and
+            input("Puzzle sequential shot testing (puzzles played with -a) is: " + str(puzzle.get("sequential", False)) + " | Change? ") == "y"):
+        puzzle["sequential"] = input("Enter puzzle sequential: ").lower() in ["true", "y"]
+
     validatePuzzle(puzzle)
+    if input("Skip solvability check? ") != "y":
+        checkSolvable(puzzle)
 
     if input("Save changes?: ") == "y":
         with open("puzzles/" + fname + ".json", "w+") as f:
             json.dump(puzzle, f, indent=4)
+        print("Puzzle saved. Packs that use it are ignored until they are rebuilt with buildpack.")
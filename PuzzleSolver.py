@@ -0,0 +1,173 @@
+import numpy as np
+import time
+import warnings
+from errors import InternalCommandException
+from GateAssembler import updateGate
+from GateRegistry import gateinfo
+from StatevectorSimulator import applyGate, zeroState, flatten, noopgates, stochasticgates, exactJSON
+from PuzzleValidation import PuzzleValidator, fidelity, totalVariation, fidelitytolerance
+
+#Breadth first search for the shortest gate sequence that solves a puzzle, using only the gates the puzzle unlocks.
+#States are memoized by a key with the global phase removed and the amplitudes rounded, so gate sequences that reach
+#an already seen state are pruned and the search stays small for the editor's row counts.
+#Every search runs on a state and time budget. When it runs out the answer is unknown rather than "no solution".
+
+paramangles = [45, 90, 135, 180, 225, 270, 315] #angles tried for rotation gates when the puzzle allows params
+defaultmaxdepth = 6
+defaultmaxstates = 200000
+defaultmaxseconds = None
+interactivemaxstates = 20000 #budget for checks that run while a puzzle is edited
+interactivemaxseconds = 3.0
+keydigits = 6
+
+def stateKey(state):
+    """Hashable key for a state, equal for states that only differ by global phase or rounding noise."""
+    vector = flatten(state)
+    first = np.nonzero(np.abs(vector) > 1e-3)[0][0]
+    vector = vector * (np.conj(vector[first]) / np.abs(vector[first]))
+    return np.round(vector.real, keydigits).tobytes() + np.round(vector.imag, keydigits).tobytes()
+
+def puzzleMoves(puzzlejson, rowcount):
+    """Every (gatejson, row) a player could place with the puzzle's unlocked gates."""
+    gates = []
+    for group in puzzlejson["unlocked-gates"]:
+        for gate in group:
+            if gate not in gates and gate not in noopgates and gate not in stochasticgates:
+                gates.append(gate)
+
+    #angles used by the author's solution are tried as well, so puzzles with unusual angles stay solvable
+    angles = list(paramangles)
+    for row in puzzlejson["validation-circuit"]["rows"]:
+        for gatejson in row["gates"]:
+            for angle in gatejson.get("params", []):
+                if angle % 360 != 0 and angle % 360 not in angles:
+                    angles.append(angle % 360)
+
+    variants = []
+    for gate in gates:
+        gatejson = {"type": gate}
+        if gate in ["u", "cu"]:
+            gatejson["params"] = [0, 0, 0]
+        if gate != "swap":
+            variants.append(gatejson)
+        if puzzlejson["allowparams"] and gate in ["x", "y", "z"]:
+            for angle in angles:
+                variants.append(updateGate({"type": gate, "params": [angle]}))
+
+    moves = []
+    for gatejson in variants:
+        for row in range(0, rowcount):
+            moves.append((gatejson, row))
+            if puzzlejson["allowcontrol"] or gatejson["type"] == "swap":
+                for control in range(0, rowcount):
+                    if control != row:
+                        controlled = dict(gatejson, control=[control])
+                        if gateinfo[controlled["type"]].controls != 1:
+                            updateGate(controlled)
+                        moves.append((controlled, row))
+    return moves
+
+def goalFunction(validator):
+    """Returns a function telling if a state passes the puzzle, mirroring the validator's checks."""
+    target = validator.target
+    if validator.validationMode == "statevector" and target.statevector is not None:
+        return lambda state: fidelity(flatten(state), target.statevector) >= 1 - fidelitytolerance
+
+    tolerance = validator.tolerance if validator.validationMode == "results" else fidelitytolerance
+    return lambda state: totalVariation(np.abs(flatten(state)) ** 2, target.probabilities) <= tolerance
+
+def startState(circuitjson, rowcount):
+    """State of a starting circuit, or |0..0> when there is none."""
+    if circuitjson is None:
+        return zeroState(rowcount)
+    if len(circuitjson["rows"]) != rowcount:
+        warnings.warn("Starting circuit has " + str(len(circuitjson["rows"])) + " rows but the puzzle needs " +
+                      str(rowcount) + ".")
+        raise InternalCommandException
+    result = exactJSON(circuitjson)
+    if result.statevector is None:
+        warnings.warn("Can't search from a circuit with mid circuit measurements.")
+        raise InternalCommandException
+    return np.array(result.statevector).reshape((2,) * rowcount)
+
+def solvePuzzle(puzzlejson, validator=None, circuitjson=None, maxdepth=defaultmaxdepth, maxstates=defaultmaxstates,
+                maxseconds=defaultmaxseconds):
+    """Shortest list of (gatejson, row) moves that, appended to circuitjson (or an empty circuit), solves the puzzle.
+    Returns (moves, finished). moves is None when no solution was found. finished is False when the search stopped
+    because it saw more than maxstates states or ran longer than maxseconds, so a missing solution is unknown."""
+    if validator is None:
+        validator = PuzzleValidator(puzzlejson, puzzlejson.get("tolerance", 0.1))
+    rowcount = len(puzzlejson["validation-circuit"]["rows"])
+    moves = puzzleMoves(puzzlejson, rowcount)
+    isGoal = goalFunction(validator)
+    deadline = None if maxseconds is None else time.perf_counter() + maxseconds
+
+    start = startState(circuitjson, rowcount)
+    if isGoal(start):
+        return [], True
+
+    #every reached state keeps (parent node, move) instead of its whole path, node 0 is the start
+    parents = [(None, None)]
+    seen = {stateKey(start)}
+    frontier = [(start, 0)]
+    for _ in range(0, maxdepth):
+        nextfrontier = []
+        for state, node in frontier:
+            if deadline is not None and time.perf_counter() > deadline:
+                return None, False
+            for gatejson, row in moves:
+                newstate = state.copy()
+                applyGate(newstate, gatejson, row, rowcount)
+                key = stateKey(newstate)
+                if key in seen:
+                    continue
+                parents.append((node, (gatejson, row)))
+                if isGoal(newstate):
+                    return tracePath(parents, len(parents) - 1), True
+                seen.add(key)
+                if len(seen) > maxstates:
+                    return None, False
+                nextfrontier.append((newstate, len(parents) - 1))
+        frontier = nextfrontier
+        if len(frontier) == 0:
+            break
+    return None, True
+
+def tracePath(parents, node):
+    """Moves from the start to node, following the parent links."""
+    path = []
+    while parents[node][0] is not None:
+        node, move = parents[node]
+        path.append(move)
+    path.reverse()
+    return path
+
+def solutionCircuit(moves, rowcount):
+    """Circuit json placing each move in its own column."""
+    rows = [{"gates": []} for _ in range(0, rowcount)]
+    for gatejson, row in moves:
+        for index, rowjson in enumerate(rows):
+            if index == row:
+                rowjson["gates"].append(dict(gatejson))
+            elif index in gatejson.get("control", []):
+                rowjson["gates"].append({"type": "multi"})
+            else:
+                rowjson["gates"].append({"type": "empty"})
+    return {"rows": rows}
+
+def describeMove(move):
+    gatejson, row = move
+    text = gatejson["type"] + " on row " + str(row)
+    if len(gatejson.get("control", [])) > 0:
+        text += " controlled by row " + ", ".join(str(c) for c in gatejson["control"])
+    if len(gatejson.get("params", [])) > 0:
+        text += " with params " + str(gatejson["params"])
+    return text
+
+def hint(puzzlejson, circuitjson, validator=None, maxdepth=defaultmaxdepth, maxstates=defaultmaxstates,
+         maxseconds=defaultmaxseconds):
+    """(the next gate to add to circuitjson on a shortest path to the solution or None, finished) as in solvePuzzle."""
+    moves, finished = solvePuzzle(puzzlejson, validator, circuitjson, maxdepth, maxstates, maxseconds)
+    if moves is None or len(moves) == 0:
+        return None, finished
+    return moves[0], finished
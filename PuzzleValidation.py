@@ -0,0 +1,172 @@
+import numpy as np
+import hashlib
+import os
+import warnings
+from math import sqrt, log
+from errors import InternalCommandException
+from StatevectorSimulator import SimulationResult, exactJSON
+
+#Puzzle validation only needs numpy, so batch grading workers can import it without pygame or qiskit.
+
+#region internal validators
+fidelitytolerance = 1e-6
+
+def fidelity(statevectora, statevectorb):
+    """|<a|b>|^2, which ignores global phase."""
+    return float(np.abs(np.vdot(statevectora, statevectorb)) ** 2)
+
+def totalVariation(probabilitiesa, probabilitiesb):
+    return float(0.5 * np.sum(np.abs(probabilitiesa - probabilitiesb)))
+
+def validateStatevector(circuitjson, target, tolerance):
+    if tolerance == tolerance:
+        pass
+    a = exactJSON(circuitjson)
+    b = target
+    if len(a.probabilities) != len(b.probabilities):
+        return False
+
+    if a.statevector is None or b.statevector is None:
+        #mid circuit measurements leave a mixed state, so the exact distributions are compared instead
+        return totalVariation(a.probabilities, b.probabilities) <= fidelitytolerance
+    return fidelity(a.statevector, b.statevector) >= 1 - fidelitytolerance
+
+def validateResults(circuitjson, target, tolerance):
+    a = exactJSON(circuitjson)
+    b = target
+    if len(a.probabilities) != len(b.probabilities):
+        return False
+    return totalVariation(a.probabilities, b.probabilities) <= tolerance
+
+#sequential results validation draws shots in doubling batches and stops as soon as a confidence interval for the total
+#variation to the target lies entirely on one side of the tolerance. It is only for circuits that are really sampled
+#(aer or hardware), exact distributions are compared directly by validateResults.
+#The total variation is the largest q(A) - p(A) over the subsets A of the target's support, so the interval comes from
+#a binomial (Chernoff) bound on the shot frequency of every such subset. Near deterministic targets need very few shots.
+sequentialconfidence = 0.95
+sequentialfirstbatch = 32
+sequentialmaxshots = 8192
+maxenumeratedsupport = 12 #bigger supports bound every subset with the same hoeffding width instead
+
+def bernoulliKL(p, q):
+    p = np.clip(p, 0.0, 1.0)
+    q = np.clip(q, 1e-15, 1 - 1e-15)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        a = np.where(p > 0, p * np.log(p / q), 0.0)
+        b = np.where(p < 1, (1 - p) * np.log((1 - p) / (1 - q)), 0.0)
+    return a + b
+
+def chernoffBound(frequency, shots, level, upper):
+    """Furthest proportion x above (or below) each observed frequency with shots * kl(frequency, x) <= level, so the
+    true proportion is beyond it with probability at most exp(-level)."""
+    inside = np.array(frequency, dtype=float)
+    outside = np.ones_like(inside) if upper else np.zeros_like(inside)
+    for _ in range(0, 50):
+        middle = (inside + outside) / 2
+        within = shots * bernoulliKL(frequency, middle) <= level
+        inside = np.where(within, middle, inside)
+        outside = np.where(within, outside, middle)
+    return inside
+
+def distanceBounds(frequencies, shots, target, alpha):
+    """(lower, upper) bounds on the total variation between the sampled distribution and target. Each side holds with
+    probability 1 - alpha."""
+    support = np.nonzero(target > 1e-12)[0]
+    if len(support) > maxenumeratedsupport:
+        distance = totalVariation(frequencies, target)
+        width = sqrt((len(support) * log(2) + log(1 / alpha)) / (2 * shots))
+        return distance - width, distance + width
+
+    subsets = ((np.arange(1, 2 ** len(support))[:, None] >> np.arange(0, len(support))) & 1).astype(bool)
+    level = log(len(subsets) / alpha)
+    targetmass = subsets @ target[support]
+    sampledmass = subsets @ frequencies[support]
+    lower = np.max(targetmass - chernoffBound(sampledmass, shots, level, True))
+    upper = np.max(targetmass - chernoffBound(sampledmass, shots, level, False))
+    return lower, upper
+
+def validateResultsSequential(sampler, target, tolerance, confidence=sequentialconfidence,
+                              firstbatch=sequentialfirstbatch, maxshots=sequentialmaxshots):
+    """Shot based results validation. sampler(shots) runs the circuit and returns fresh counts as an array indexed
+    like target.probabilities. Returns (passed, shots used)."""
+    looks = int(np.floor(np.log2(maxshots / firstbatch))) + 1
+    alpha = (1 - confidence) / looks #bonferroni, every look gets an equal share of the error budget
+
+    counts = np.zeros(len(target.probabilities))
+    shots = 0
+    batch = firstbatch
+    while True:
+        batchcounts = sampler(batch)
+        if len(batchcounts) != len(counts):
+            return False, shots + batch
+        counts += batchcounts
+        shots += batch
+        lower, upper = distanceBounds(counts / shots, shots, target.probabilities, alpha)
+        if upper <= tolerance:
+            return True, shots
+        if lower > tolerance:
+            return False, shots
+        if shots >= maxshots:
+            return totalVariation(counts / shots, target.probabilities) <= tolerance, shots
+        batch = min(shots, maxshots - shots)
+
+def validateNone(circuitjson, target, tolerance):
+    if circuitjson == target or tolerance == tolerance:
+        pass
+    warnings.warn("Validation none error case triggered!")
+    raise InternalCommandException
+
+targetcachedir = "resources/dynamic/targets/"
+
+def puzzleHash(rawpuzzle):
+    return hashlib.sha1(rawpuzzle).hexdigest()
+
+def loadTarget(puzzlehash):
+    """Returns the persisted target for a puzzle file hash, or None."""
+    try:
+        with np.load(targetcachedir + puzzlehash + ".npz") as data:
+            statevector = data["statevector"] if data["haspure"] else None
+            return SimulationResult(statevector, {}, data["probabilities"])
+    except (FileNotFoundError, KeyError, ValueError):
+        return None
+
+def saveTarget(puzzlehash, target):
+    os.makedirs(targetcachedir, exist_ok=True)
+    statevector = target.statevector if target.statevector is not None else np.zeros(0, dtype=complex)
+    np.savez(targetcachedir + puzzlehash + ".npz", statevector=statevector, probabilities=target.probabilities,
+             haspure=target.statevector is not None)
+
+class PuzzleValidator:
+    """Holds the exact target of a puzzle, computed once (or read from the target cache when the puzzle
+    file hash is known) and reused by every check and target render."""
+    def __init__(self, puzzlejson, tolerance, puzzlehash=None, target=None):
+        self.correctcircuitjson = puzzlejson["validation-circuit"]
+        self.validationMode = puzzlejson["validation-mode"]
+        self.validationFunction = validateNone
+        self.tolerance = tolerance
+        if puzzlejson["validation-mode"] == "statevector":
+            self.validationFunction = validateStatevector
+        elif puzzlejson["validation-mode"] == "results":
+            self.validationFunction = validateResults
+
+        self.sequential = puzzlejson.get("sequential", False)
+        self.shotsused = None
+
+        self.target = target
+        if self.target is None and puzzlehash is not None:
+            self.target = loadTarget(puzzlehash)
+        if self.target is None:
+            self.target = exactJSON(self.correctcircuitjson)
+            if puzzlehash is not None:
+                saveTarget(puzzlehash, self.target)
+
+    def validate(self, circuitjson, sampler=None):
+        """Checks circuitjson against the target. Results puzzles marked sequential that are run on a sampling
+        backend pass its sampler (see validateResultsSequential), the shots it took are left in shotsused.
+        Everything else compares exact distributions."""
+        self.shotsused = None
+        if self.validationMode == "results" and self.sequential and sampler is not None:
+            passed, self.shotsused = validateResultsSequential(sampler, self.target, self.tolerance)
+            return passed
+        return self.validationFunction(circuitjson, self.target, self.tolerance)
+#endregion
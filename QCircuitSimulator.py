@@ -6,8 +6,16 @@ from qiskit.providers.aer import AerSimulator as Aer
 from qiskit.tools.monitor import job_monitor
 from qiskit import QuantumCircuit
 from errors import InternalCommandException
+from CircuitJSONTools import assembleCircuit
+from CircuitCache import transpiledcache, resultcache, circuitHash
+from ParametricCircuit import parametricCircuit
+import StatevectorSimulator
+import StabilizerSimulator
+import MPSSimulator
+import ReversibleSimulator
 from qiskit.visualization import plot_histogram, plot_bloch_multivector
 import warnings
+import numpy as np
 import matplotlib.pyplot as pyplot
 import threading
 
@@ -116,15 +124,106 @@ def add_measurements(circuit: QuantumCircuit):
         circuit.measure(i, i)
     return circuit
 
-def simulate(circuit, shots=1000):
+def simulate(circuit, shots=1000, key=None, seed=None):
+    """Runs a QuantumCircuit on aer. Passing a circuit hash as key reuses an earlier transpile."""
     simulator = Aer()
-    circuit.save_statevector()
-    circuit = add_measurements(circuit)
-    compiled_circuit = transpile(circuit, simulator)
-    job = simulator.run(compiled_circuit, shots=shots)
+    compiled_circuit = None
+    if key is not None:
+        compiled_circuit = transpiledcache.get(key)
+
+    if compiled_circuit is None:
+        circuit.save_statevector()
+        circuit = add_measurements(circuit)
+        compiled_circuit = transpile(circuit, simulator)
+        if key is not None:
+            transpiledcache.put(key, compiled_circuit)
+    if seed is None:
+        job = simulator.run(compiled_circuit, shots=shots)
+    else:
+        job = simulator.run(compiled_circuit, shots=shots, seed_simulator=seed)
     result = job.result()
     return result
 
+def simulateParametric(circuitjson, shots=1000, seed=None):
+    """Runs circuit json on aer from its ParametricCircuit. The template is transpiled once, circuits that only
+    differ in gate angles just bind their params into it."""
+    simulator = Aer()
+    template = parametricCircuit(circuitjson)
+    if template.compiled is None:
+        circuit = template.circuit.copy()
+        circuit.save_statevector()
+        template.compiled = transpile(add_measurements(circuit), simulator)
+    compiled_circuit = template.bind(template.compiled, circuitjson)
+    if seed is None:
+        job = simulator.run(compiled_circuit, shots=shots)
+    else:
+        job = simulator.run(compiled_circuit, shots=shots, seed_simulator=seed)
+    return job.result()
+
+def shotSampler(circuitjson):
+    """Function drawing fresh aer shots of circuit json, as counts indexed like the statevector.
+    Used for sequential puzzle validation, so it bypasses the result cache."""
+    rowcount = len(circuitjson["rows"])
+
+    def sample(shots):
+        counts = np.zeros(2 ** rowcount)
+        for key, count in simulateParametric(circuitjson, shots).get_counts().items():
+            counts[int(key.replace(" ", ""), 2)] += count
+        return counts
+    return sample
+
+simulationbackends = ["native", "reversible", "stabilizer", "mps", "aer"]
+defaultbackend = "native"
+checkbackend = None #backend the editor's check button draws shots from for sequential results puzzles, None is exact
+
+def simulateJSON(circuitjson, shots=1000, backend=None, incremental=None, maxbond=None, seed=None):
+    """Simulates circuit json. The native numpy engine is used unless aer is requested.
+    Native runs of reversible classical circuits (x, cx, ccx, swap, cswap) use integer bit operations.
+    Other native runs that are too wide for a statevector switch to the stabilizer engine when the circuit is
+    clifford only, and to the matrix product state engine (bond dimension capped at maxbond) otherwise.
+    An IncrementalSimulator can be passed to reuse column states from earlier runs. Passing a seed makes the
+    sampled counts reproducible."""
+    if backend is None:
+        backend = defaultbackend
+
+    if backend == "native" and ReversibleSimulator.isReversible(circuitjson):
+        backend = "reversible"
+    elif backend == "native" and len(circuitjson["rows"]) > StatevectorSimulator.maxstatevectorrows:
+        if StabilizerSimulator.isClifford(circuitjson):
+            backend = "stabilizer"
+        else:
+            backend = "mps"
+
+    circuithash = circuitHash(circuitjson)
+    if backend == "mps":
+        circuithash = (circuithash, maxbond)
+    result = resultcache.get((circuithash, shots, backend, seed))
+    if result is not None:
+        return result
+
+    if backend == "native" and incremental is not None:
+        result = incremental.simulate(circuitjson, shots, seed)
+    elif backend == "native":
+        result = StatevectorSimulator.simulateJSON(circuitjson, shots, seed)
+    elif backend == "reversible":
+        result = ReversibleSimulator.simulateJSON(circuitjson, shots)
+    elif backend == "stabilizer":
+        result = StabilizerSimulator.simulateJSON(circuitjson, shots, seed)
+    elif backend == "mps":
+        result = MPSSimulator.simulateJSON(circuitjson, shots, maxbond, seed)
+    elif backend == "aer" and isinstance(circuitjson, dict):
+        result = simulateParametric(circuitjson, shots, seed)
+    elif backend == "aer":
+        result = simulate(assembleCircuit(circuitjson), shots, key=circuithash, seed=seed)
+    else:
+        warnings.warn("Unknown simulation backend: " + str(backend))
+        raise InternalCommandException
+    return resultcache.put((circuithash, shots, backend, seed), result)
+
+def exactJSON(circuitjson):
+    """Exact distribution (and statevector when there are no mid circuit measurements) without any shots."""
+    return StatevectorSimulator.exactJSON(circuitjson)
+
 def sendToIBM(circuit, shots=1000, useSimulator=False):
     if not provideractive:
         print("Issue loading account... Please wait while we retry...")
@@ -0,0 +1,41 @@
+import random
+from GateRegistry import gateinfo
+
+#Random circuit json for the benchmarks and the tests. Only GateRegistry is needed, so nothing here pulls in qiskit.
+
+def emptyCircuit(rowcount, depth):
+    return {"rows": [{"gates": [{"type": "empty"} for _ in range(0, depth)]} for _ in range(0, rowcount)]}
+
+def randomCircuit(rowcount, depth, singlegates=None, controlgates=None, controlchance=0.2, seed=0):
+    """Builds circuit json with one random gate per row and column, a fraction of them controlled.
+    Control rows get a multi placeholder like the editor leaves."""
+    if singlegates is None:
+        singlegates = ["h", "x", "y", "z", "rx", "ry", "rz"]
+    if controlgates is None:
+        controlgates = ["cx", "cz", "crx"]
+    rng = random.Random(seed)
+    rows = [{"gates": []} for _ in range(0, rowcount)]
+    for _ in range(0, depth):
+        column = [{"type": "empty"} for _ in range(0, rowcount)]
+        free = list(range(0, rowcount))
+        rng.shuffle(free)
+        while len(free) > 0:
+            row = free.pop()
+            gate = None
+            if len(controlgates) > 0 and len(free) > 0 and rng.random() < controlchance:
+                gate = {"type": rng.choice(controlgates)}
+                controlcount = max(1, gateinfo[gate["type"]].controls)
+                if controlcount > len(free):
+                    gate = None #not enough rows left in this column
+                else:
+                    gate["control"] = [free.pop() for _ in range(0, controlcount)]
+                    for control in gate["control"]:
+                        column[control] = {"type": "multi"}
+            if gate is None:
+                gate = {"type": rng.choice(singlegates)}
+            if gate["type"] in gateinfo and gateinfo[gate["type"]].params > 0:
+                gate["params"] = [round(rng.uniform(-180, 180), 2) for _ in range(0, gateinfo[gate["type"]].params)]
+            column[row] = gate
+        for row, gate in zip(rows, column):
+            row["gates"].append(gate)
+    return {"rows": rows}
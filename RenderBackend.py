@@ -4,7 +4,7 @@ import warnings
 import json
 from PygameTools import config, ClickMode, ClickLocation
 import PygameTools
-from CircuitJSONTools import validgates
+from GateRegistry import gateinfo, validgates, registerStyles
 from textwrap import wrap
 
 class WarningMessage:
@@ -34,6 +34,7 @@ clickLocations = []
 
 with open("resources/gategraphics.json") as f:
     gategraphics = json.load(f)
+registerStyles(gategraphics)
 
 images = {}
 def verifyGateGraphics():
@@ -70,17 +71,13 @@ def verifyGateGraphics():
                     warnings.warn("Group: " + str(group["group"]) + " missing text.")
                     raise InternalCommandException
     for gate in validgates:
-        found = False
-        for group in gategraphics:
-            if gate in group["group"]:
-                found = True
-        if not found and gate not in ["empty", "multi"]:
+        if gateinfo[gate].style is None and gate not in ["empty", "multi"]:
             warnings.warn("No graphics found for: " + str(gate))
             raise InternalCommandException
 
     for group in gategraphics:
         for gate in group["group"]:
-            if gate not in validgates:
+            if gate not in gateinfo:
                 warnings.warn("Extra graphics found for: " + str(gate))
                 raise InternalCommandException
 
@@ -164,9 +161,8 @@ def drawGate(screen, gate: dict, x, y):
     if len(pstring) > 8:
         pstring = pstring[0:6] + "..."
 
-    for group in gategraphics:
-        if name in group["group"]:
-            gateconfig = group
+    if name in gateinfo and gateinfo[name].style is not None:
+        gateconfig = gateinfo[name].style
 
     if gateconfig == {}:
         warnings.warn("No gategraphics found for gate: " + str(name))
@@ -231,11 +227,7 @@ def drawTool(screen, name, x, y):
         screen.blit(images["delete.png"], (x - config.imageSize / 2, y - config.imageSize / 2))
 
 def getGateColor(gate):
-    gateconfig = {}
-    for group in gategraphics:
-        if gate in group["group"]:
-            gateconfig = group
-    return gateconfig["background-color"]
+    return gateinfo[gate].style["background-color"]
 
 def connectControl(screen, color, x, y1, y2):
     pygame.draw.line(screen, color, (x, y1), (x, y2), config.controlWireThickness)
@@ -262,7 +254,7 @@ def drawGateToolbox(screen, allowedgates, allowedtools):
     for minilist in allowedgates:
         gatepos += gatemargin
         for gate in minilist:
-            if gate not in validgates:
+            if gate not in gateinfo:
                 warnings.warn("Gate: " + str(gate) + " not valid.")
                 raise InternalCommandException
             drawGate(screen, {"type": gate}, gatepos, midy)
@@ -0,0 +1,71 @@
+import numpy as np
+import warnings
+from errors import InternalCommandException
+from StatevectorSimulator import SimulationResult, idlegates, maxstatevectorrows
+
+#Circuits made only of x, cx, ccx, swap and cswap send basis states to basis states,
+#so they can run as bit operations on one integer register in O(gates) time for any number of rows.
+
+reversiblegates = idlegates + ["multi", "x", "cx", "ccx", "swap", "cswap", "m", "reset"]
+
+def isReversible(circuitjson):
+    for row in circuitjson["rows"]:
+        for gatejson in row["gates"]:
+            if gatejson["type"] not in reversiblegates:
+                return False
+    return True
+
+def bit(register, row):
+    return (register >> row) & 1
+
+def applyGate(register, gatejson, row):
+    gate = gatejson["type"]
+    control = gatejson.get("control", [])
+
+    if gate in idlegates or gate in ["multi", "m"]: #measuring a basis state does not change it
+        pass
+    elif gate == "x":
+        register ^= 1 << row
+    elif gate == "cx":
+        if bit(register, control[0]):
+            register ^= 1 << row
+    elif gate == "ccx":
+        if bit(register, control[0]) and bit(register, control[1]):
+            register ^= 1 << row
+    elif gate in ["swap", "cswap"]:
+        if gate == "swap" or bit(register, control[0]):
+            other = control[-1]
+            if bit(register, other) != bit(register, row):
+                register ^= (1 << other) | (1 << row)
+    elif gate == "reset":
+        register &= ~(1 << row)
+    else:
+        warnings.warn("Gate <" + str(gate) + "> is not reversible classical.")
+        raise InternalCommandException
+    return register
+
+def runRegister(circuitjson, register=0):
+    """Returns the integer register after running the circuit on basis state <register>."""
+    rows = circuitjson["rows"]
+    for x in range(0, len(rows[0]["gates"])):
+        for index, row in enumerate(rows):
+            register = applyGate(register, row["gates"][x], index)
+    return register
+
+def simulateJSON(circuitjson, shots=1000):
+    """Simulates a reversible classical circuit. Every shot gives the same outcome.
+    A statevector is only built for circuits narrow enough for the statevector engine."""
+    if not isReversible(circuitjson):
+        warnings.warn("Circuit is not reversible classical.")
+        raise InternalCommandException
+
+    rowcount = len(circuitjson["rows"])
+    register = runRegister(circuitjson)
+
+    statevector = None
+    probabilities = None
+    if rowcount <= maxstatevectorrows:
+        statevector = np.zeros(2 ** rowcount, dtype=complex)
+        statevector[register] = 1
+        probabilities = np.abs(statevector) ** 2
+    return SimulationResult(statevector, {format(register, "0" + str(rowcount) + "b"): shots}, probabilities)
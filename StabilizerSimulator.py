@@ -0,0 +1,197 @@
+import numpy as np
+import warnings
+from errors import InternalCommandException
+from StatevectorSimulator import SimulationResult, noopgates, firstStochasticColumn
+
+#Aaronson-Gottesman (CHP) tableau engine for Clifford only circuits.
+#Memory is O(rows^2) and each gate is O(rows), so the editor's 50 row limit is no problem.
+
+cliffordgates = noopgates + ["h", "x", "y", "z", "cx", "cy", "cz", "swap", "m", "reset"]
+
+def isClifford(circuitjson):
+    for row in circuitjson["rows"]:
+        for gatejson in row["gates"]:
+            if gatejson["type"] not in cliffordgates:
+                return False
+    return True
+
+class Tableau:
+    """Rows 0..n-1 are destabilizers, n..2n-1 stabilizers and row 2n is scratch space for measurements."""
+    def __init__(self, rowcount):
+        self.n = rowcount
+        self.x = np.zeros((2 * rowcount + 1, rowcount), dtype=bool)
+        self.z = np.zeros((2 * rowcount + 1, rowcount), dtype=bool)
+        self.r = np.zeros(2 * rowcount + 1, dtype=bool)
+        for i in range(0, rowcount):
+            self.x[i, i] = True
+            self.z[rowcount + i, i] = True
+
+    def copy(self):
+        t = Tableau.__new__(Tableau)
+        t.n = self.n
+        t.x = self.x.copy()
+        t.z = self.z.copy()
+        t.r = self.r.copy()
+        return t
+
+    def h(self, a):
+        self.r ^= self.x[:, a] & self.z[:, a]
+        self.x[:, a], self.z[:, a] = self.z[:, a].copy(), self.x[:, a].copy()
+
+    def s(self, a):
+        self.r ^= self.x[:, a] & self.z[:, a]
+        self.z[:, a] ^= self.x[:, a]
+
+    def sdg(self, a):
+        self.s(a)
+        self.pauli("z", a)
+
+    def pauli(self, p, a):
+        if p in "xy":
+            self.r ^= self.z[:, a]
+        if p in "zy":
+            self.r ^= self.x[:, a]
+
+    def cx(self, a, b):
+        self.r ^= self.x[:, a] & self.z[:, b] & ~(self.x[:, b] ^ self.z[:, a])
+        self.x[:, b] ^= self.x[:, a]
+        self.z[:, a] ^= self.z[:, b]
+
+    def cz(self, a, b):
+        self.h(b)
+        self.cx(a, b)
+        self.h(b)
+
+    def cy(self, a, b):
+        self.sdg(b)
+        self.cx(a, b)
+        self.s(b)
+
+    def swap(self, a, b):
+        self.cx(a, b)
+        self.cx(b, a)
+        self.cx(a, b)
+
+    def rowsum(self, targets, source):
+        """Multiplies every row in targets by row <source>, tracking the phase."""
+        x1 = self.x[source]
+        z1 = self.z[source]
+        x2 = self.x[targets].astype(int)
+        z2 = self.z[targets].astype(int)
+        g = np.where(x1 & z1, z2 - x2, 0) + np.where(x1 & ~z1, z2 * (2 * x2 - 1), 0) + \
+            np.where(~x1 & z1, x2 * (1 - 2 * z2), 0)
+        phase = (2 * self.r[targets] + 2 * self.r[source] + np.sum(g, axis=1)) % 4
+        self.r[targets] = phase == 2
+        self.x[targets] ^= x1
+        self.z[targets] ^= z1
+
+    def measure(self, a, rng=None):
+        """Measures row a and returns the bit. Random outcomes use rng, or 0 when rng is None."""
+        n = self.n
+        stabilizers = np.nonzero(self.x[n:2 * n, a])[0]
+        if len(stabilizers) > 0:
+            p = n + stabilizers[0]
+            others = [i for i in np.nonzero(self.x[0:2 * n, a])[0] if i != p]
+            if len(others) > 0:
+                self.rowsum(others, p)
+            self.x[p - n], self.z[p - n], self.r[p - n] = self.x[p], self.z[p], self.r[p]
+            self.x[p] = False
+            self.z[p] = False
+            self.z[p, a] = True
+            self.r[p] = bool(rng.integers(0, 2)) if rng is not None else False
+            return int(self.r[p])
+
+        self.x[2 * n] = False
+        self.z[2 * n] = False
+        self.r[2 * n] = False
+        for i in np.nonzero(self.x[0:n, a])[0]:
+            self.rowsum([2 * n], i + n)
+        return int(self.r[2 * n])
+
+    def apply(self, gatejson, row, rng=None):
+        gate = gatejson["type"]
+        control = gatejson.get("control", [])
+        if gate in noopgates:
+            pass
+        elif gate == "h":
+            self.h(row)
+        elif gate in ["x", "y", "z"]:
+            self.pauli(gate, row)
+        elif gate == "cx":
+            self.cx(control[0], row)
+        elif gate == "cy":
+            self.cy(control[0], row)
+        elif gate == "cz":
+            self.cz(control[0], row)
+        elif gate == "swap":
+            self.swap(control[0], row)
+        elif gate == "m":
+            if rng is not None: #without rng this is a terminal measurement, which the final sampling covers
+                self.measure(row, rng)
+        elif gate == "reset":
+            if self.measure(row, rng):
+                self.pauli("x", row)
+        else:
+            warnings.warn("Gate <" + str(gate) + "> is not a clifford gate.")
+            raise InternalCommandException
+
+    def outcomeSpace(self):
+        """Returns (b0, basis): every computational basis outcome is b0 xor a combination of basis rows,
+        all with equal probability."""
+        n = self.n
+        basis = self.x[n:2 * n].copy()
+        rank = 0
+        for col in range(0, n):
+            pivots = np.nonzero(basis[rank:, col])[0]
+            if len(pivots) == 0:
+                continue
+            pivot = rank + pivots[0]
+            basis[[rank, pivot]] = basis[[pivot, rank]]
+            others = np.nonzero(basis[:, col])[0]
+            others = others[others != rank]
+            basis[others] ^= basis[rank]
+            rank += 1
+
+        fixed = self.copy()
+        b0 = np.array([fixed.measure(a) for a in range(0, n)], dtype=bool)
+        return b0, basis[0:rank]
+
+def sampleTableau(tableau, shots, rng):
+    b0, basis = tableau.outcomeSpace()
+    coeffs = rng.integers(0, 2, size=(shots, len(basis)), dtype=np.uint8)
+    bits = (b0.astype(np.uint8) + coeffs.astype(np.int64) @ basis.astype(np.int64)) % 2
+    return bits.astype(bool)
+
+def bitsToCounts(bits):
+    """Turns a (shots, rows) bool array into counts keyed like qiskit (row 0 is the last character)."""
+    rowsbits, counts = np.unique(bits, axis=0, return_counts=True)
+    return {"".join("1" if b else "0" for b in reversed(r)): int(c) for r, c in zip(rowsbits, counts)}
+
+def simulateJSON(circuitjson, shots=1000, seed=None):
+    """Simulates a clifford only circuit. The result has counts but no statevector."""
+    if not isClifford(circuitjson):
+        warnings.warn("Stabilizer simulation needs a clifford only circuit.")
+        raise InternalCommandException
+
+    rows = circuitjson["rows"]
+    depth = len(rows[0]["gates"])
+    rng = np.random.default_rng(seed)
+    stochasticcol = firstStochasticColumn(circuitjson)
+
+    tableau = Tableau(len(rows))
+    for x in range(0, stochasticcol):
+        for index, row in enumerate(rows):
+            tableau.apply(row["gates"][x], index)
+
+    if stochasticcol == depth:
+        return SimulationResult(None, bitsToCounts(sampleTableau(tableau, shots, rng)))
+
+    #mid circuit measurements collapse the state, so every shot gets its own trajectory
+    bits = []
+    for _ in range(0, shots):
+        t = tableau.copy()
+        for x in range(stochasticcol, depth):
+            for index, row in enumerate(rows):
+                t.apply(row["gates"][x], index, rng)
+        bits.append(sampleTableau(t, 1, rng)[0])
+    return SimulationResult(None, bitsToCounts(np.array(bits)))
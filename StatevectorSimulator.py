@@ -0,0 +1,409 @@
+import numpy as np
+import warnings
+from errors import InternalCommandException
+from CircuitCache import resultcache, circuitHash
+from GateRegistry import gateinfo, paulimatrices, gateUnitary
+
+#Native statevector engine. Works directly on circuit json so small circuits never touch qiskit.
+#Qubit <row> lives on tensor axis -(row + 1), so flattening the state gives qiskit's little endian ordering.
+#simulateJSON, exactJSON and stageStates also take a CompactCircuit, whose cells are read from its arrays one column
+#at a time through circuitShape, circuitColumn and gateTypes.
+
+noopgates = ["empty", "multi", "barrier", "i", "puzzle"]
+idlegates = ["empty", "barrier", "i", "puzzle"]
+stochasticgates = ["m", "reset"]
+singlerowgates = ["h", "x", "y", "z", "rx", "ry", "rz", "u"]
+layerchunk = 4 #rows per batched kernel, the kernel is a (2^layerchunk)x(2^layerchunk) matrix
+
+def circuitShape(circuitjson):
+    """(rows, depth) of circuit json or a CompactCircuit."""
+    if not isinstance(circuitjson, dict):
+        return circuitjson.rowcount, circuitjson.depth
+    rows = circuitjson["rows"]
+    return len(rows), len(rows[0]["gates"])
+
+def circuitColumn(circuitjson, x):
+    """The cells of column x, one gatejson per row. Compact circuits build them from their arrays."""
+    if not isinstance(circuitjson, dict):
+        return circuitjson.column(x)
+    return [row["gates"][x] for row in circuitjson["rows"]]
+
+def gateTypes(circuitjson):
+    """The gate type of every cell, as one list per row."""
+    if not isinstance(circuitjson, dict):
+        return circuitjson.typeNames()
+    return [[gatejson["type"] for gatejson in row["gates"]] for row in circuitjson["rows"]]
+
+def gateMatrix(gate, params):
+    """Returns the 2x2 matrix a gate applies to its target row. Params are in degrees like the json."""
+    info = gateinfo.get(gate)
+    if info is None or info.matrix is None:
+        warnings.warn("Gate <" + str(gate) + "> has no matrix.")
+        raise InternalCommandException
+    return gateUnitary(gate, params)
+
+def zeroState(rowcount):
+    state = np.zeros((2,) * rowcount, dtype=complex)
+    state[(0,) * rowcount] = 1
+    return state
+
+def controlIndex(controls, rowcount):
+    """Index selecting the part of the state where every control row is |1>."""
+    idx = [Ellipsis]
+    for axis in range(0, rowcount):
+        row = rowcount - 1 - axis
+        if row in controls:
+            idx.append(1)
+        else:
+            idx.append(slice(None))
+    return tuple(idx)
+
+def subAxis(row, controls):
+    """Axis of <row> once the control axes have been indexed away."""
+    return -(1 + len([r for r in range(0, row) if r not in controls]))
+
+def applyMatrix(state, matrix, row, controls, rowcount):
+    idx = controlIndex(controls, rowcount)
+    axis = subAxis(row, controls)
+    sub = state[idx]
+    state[idx] = np.moveaxis(np.tensordot(matrix, sub, axes=([1], [axis])), 0, axis)
+
+def applyLayer(state, matrices):
+    """Applies 2x2 matrices on distinct rows ({row: matrix}) with one pass over the state per layerchunk rows."""
+    rows = sorted(matrices.keys())
+    for i in range(0, len(rows), layerchunk):
+        chunk = rows[i:i + layerchunk]
+        u = matrices[chunk[0]]
+        for row in chunk[1:]:
+            u = np.kron(u, matrices[row])
+        k = len(chunk)
+        axes = [-(row + 1) for row in chunk]
+        result = np.tensordot(u.reshape((2,) * (2 * k)), state, axes=(list(range(k, 2 * k)), axes))
+        state[...] = np.moveaxis(result, list(range(0, k)), axes)
+
+def applySwap(state, rowa, rowb, controls, rowcount):
+    idx = controlIndex(controls, rowcount)
+    sub = state[idx]
+    state[idx] = np.swapaxes(sub, subAxis(rowa, controls), subAxis(rowb, controls)).copy()
+
+def measureRow(state, row, rowcount, rng):
+    """Collapses <row> in place and returns the measured bit."""
+    one = controlIndex([row], rowcount)
+    zero = list(one)
+    zero[rowcount - row] = 0
+    zero = tuple(zero)
+
+    p1 = float(np.sum(np.abs(state[one]) ** 2))
+    bit = int(rng.random() < p1)
+    if bit:
+        state[zero] = 0
+        state /= np.sqrt(p1)
+    else:
+        state[one] = 0
+        state /= np.sqrt(1 - p1)
+    return bit
+
+def applyGate(state, gatejson, row, rowcount, rng=None):
+    """Applies one cell of circuit json to the state."""
+    gate = gatejson["type"]
+    control = gatejson.get("control", [])
+
+    if gate in noopgates:
+        pass
+    elif gate == "swap":
+        applySwap(state, control[0], row, [], rowcount)
+    elif gate == "cswap":
+        applySwap(state, control[1], row, [control[0]], rowcount)
+    elif gate == "m":
+        if rng is not None: #without rng this is a terminal measurement, which the final sampling covers
+            measureRow(state, row, rowcount, rng)
+    elif gate == "reset":
+        if measureRow(state, row, rowcount, rng):
+            applyMatrix(state, paulimatrices["x"], row, [], rowcount)
+    else:
+        applyMatrix(state, gateMatrix(gate, gatejson.get("params", [])), row, control, rowcount)
+
+def runColumns(state, circuitjson, start, stop, rng=None):
+    """Runs columns start..stop-1. The single row gates of a column are applied together as one layer."""
+    rowcount, _ = circuitShape(circuitjson)
+    for x in range(start, stop):
+        layer = {}
+        for index, gatejson in enumerate(circuitColumn(circuitjson, x)):
+            if gatejson["type"] in singlerowgates:
+                layer[index] = gateMatrix(gatejson["type"], gatejson.get("params", []))
+            else:
+                applyGate(state, gatejson, index, rowcount, rng)
+        applyLayer(state, layer)
+    return state
+
+def fuseColumns(circuitjson, start, stop):
+    """Gate fusion pass. Returns a list of ops where runs of single row gates on a row are multiplied into one
+    2x2 matrix, and pending matrices are only flushed (as one layer) when a multi row gate needs their rows.
+    Ops are ("layer", {row: matrix}) or ("gate", gatejson, row)."""
+    ops = []
+    pending = {}
+
+    def flush(flushrows):
+        layer = {row: pending.pop(row) for row in flushrows if row in pending}
+        if len(layer) > 0:
+            ops.append(("layer", layer))
+
+    for x in range(start, stop):
+        for index, gatejson in enumerate(circuitColumn(circuitjson, x)):
+            gate = gatejson["type"]
+            if gate in noopgates:
+                pass
+            elif gate in singlerowgates:
+                matrix = gateMatrix(gate, gatejson.get("params", []))
+                if index in pending:
+                    matrix = matrix @ pending[index]
+                pending[index] = matrix
+            else:
+                flush([index] + list(gatejson.get("control", [])))
+                ops.append(("gate", gatejson, index))
+    flush(list(pending.keys()))
+    return ops
+
+def runOps(state, ops, rowcount, rng=None):
+    """Applies ops from fuseColumns. Every kernel indexes rows from the last axis, so a state with leading batch
+    axes runs each batch entry at once."""
+    for op in ops:
+        if op[0] == "layer":
+            applyLayer(state, op[1])
+        else:
+            applyGate(state, op[1], op[2], rowcount, rng)
+    return state
+
+def runFused(state, circuitjson, start, stop, rng=None):
+    """Same result as runColumns, with fewer passes over the amplitudes."""
+    return runOps(state, fuseColumns(circuitjson, start, stop), circuitShape(circuitjson)[0], rng)
+
+def stochasticCells(circuitjson):
+    """Returns (col, row) of every reset and every measurement that is followed by more gates on its row.
+    Terminal measurements are left out since measuring every row at the end gives the same counts."""
+    _, depth = circuitShape(circuitjson)
+    cells = []
+    for index, gates in enumerate(gateTypes(circuitjson)):
+        lastused = -1
+        for x in range(0, depth):
+            if gates[x] not in idlegates:
+                lastused = x
+        for x in range(0, depth):
+            gate = gates[x]
+            if gate == "reset" or (gate == "m" and x < lastused):
+                cells.append((x, index))
+    return sorted(cells)
+
+def firstStochasticColumn(circuitjson):
+    cells = stochasticCells(circuitjson)
+    if len(cells) == 0:
+        return circuitShape(circuitjson)[1]
+    return cells[0][0]
+
+def flatten(state):
+    return state.reshape(-1)
+
+def sampleCounts(probs, shots, rowcount, rng):
+    """Draws every shot at once from the probability vector. The cost does not grow with shots."""
+    probs = probs / np.sum(probs)
+    counts = rng.multinomial(shots, probs)
+    outcomes = np.nonzero(counts)[0]
+    return {format(int(o), "0" + str(rowcount) + "b"): int(counts[o]) for o in outcomes}
+
+maxstatevectorrows = 24
+
+class SimulationResult:
+    """Mirrors the parts of qiskit's Result that the visualizers and validators use.
+    When the engine knows the exact outcome distribution it is kept in probabilities (indexed like the statevector)."""
+    def __init__(self, statevector, counts, probabilities=None):
+        self.statevector = statevector
+        self.counts = counts
+        self.probabilities = probabilities
+
+    def get_statevector(self, circuit=None):
+        if circuit is None:
+            pass
+        if self.statevector is None:
+            warnings.warn("This simulation did not produce a statevector.")
+            raise InternalCommandException
+        return self.statevector
+
+    def get_counts(self, circuit=None):
+        if circuit is None:
+            pass
+        return self.counts
+
+    def get_probabilities(self, mincutoff=1e-12):
+        """Returns the exact outcome distribution keyed like the counts."""
+        if self.probabilities is None:
+            warnings.warn("This simulation did not produce an exact distribution.")
+            raise InternalCommandException
+        rowcount = len(self.probabilities).bit_length() - 1
+        outcomes = np.nonzero(self.probabilities > mincutoff)[0]
+        return {format(int(o), "0" + str(rowcount) + "b"): float(self.probabilities[o]) for o in outcomes}
+
+    def sample(self, shots, seed=None):
+        """Draws a fresh set of counts from the exact distribution."""
+        if self.probabilities is None:
+            warnings.warn("This simulation did not produce an exact distribution.")
+            raise InternalCommandException
+        rowcount = len(self.probabilities).bit_length() - 1
+        return sampleCounts(self.probabilities, shots, rowcount, np.random.default_rng(seed))
+
+def finishSimulation(prefix, circuitjson, stochasticcol, shots, rng):
+    """Turns the state before the first stochastic column into a SimulationResult."""
+    rowcount, depth = circuitShape(circuitjson)
+
+    if stochasticcol == depth:
+        statevector = flatten(prefix).copy()
+        probabilities = np.abs(statevector) ** 2
+        counts = sampleCounts(probabilities, shots, rowcount, rng)
+        return SimulationResult(statevector, counts, probabilities)
+
+    #mid circuit measurements collapse the state, so every shot gets its own trajectory
+    state = prefix
+    counts = {}
+    for _ in range(0, shots):
+        state = runColumns(prefix.copy(), circuitjson, stochasticcol, depth, rng)
+        key = list(sampleCounts(np.abs(flatten(state)) ** 2, 1, rowcount, rng).keys())[0]
+        counts[key] = counts.get(key, 0) + 1
+    return SimulationResult(flatten(state), counts)
+
+def simulateJSON(circuitjson, shots=1000, seed=None):
+    """Simulates circuit json and returns a SimulationResult with the final statevector and measured counts.
+    Without mid circuit measurements or resets the shots are drawn from the final distribution in one go."""
+    rowcount, _ = circuitShape(circuitjson)
+    stochasticcol = firstStochasticColumn(circuitjson)
+    state = runFused(zeroState(rowcount), circuitjson, 0, stochasticcol)
+    return finishSimulation(state, circuitjson, stochasticcol, shots, np.random.default_rng(seed))
+
+def stageStates(circuitjson, every=1, rng=None):
+    """Generator walking the circuit once and yielding (column, statevector) after every <every> columns.
+    The last column is always yielded. Mid circuit measurements follow a single random trajectory."""
+    rowcount, depth = circuitShape(circuitjson)
+    if rng is None:
+        rng = np.random.default_rng()
+
+    state = zeroState(rowcount)
+    for x in range(0, depth):
+        runColumns(state, circuitjson, x, x + 1, rng)
+        if (x + 1) % every == 0 or x + 1 == depth:
+            yield x + 1, flatten(state).copy()
+
+def exactJSON(circuitjson):
+    """Cached runExact. The circuit must be narrow enough for a statevector."""
+    if circuitShape(circuitjson)[0] > maxstatevectorrows:
+        warnings.warn("Circuit is too wide for exact simulation.")
+        raise InternalCommandException
+
+    key = (circuitHash(circuitjson), "exact")
+    result = resultcache.get(key)
+    if result is None:
+        result = resultcache.put(key, runExact(circuitjson))
+    return result
+
+def runExact(circuitjson):
+    """Computes the exact outcome distribution without shots. Mid circuit measurements and resets split the state
+    into weighted branches instead of sampling them. The statevector is only set when the circuit has no branches."""
+    rowcount, depth = circuitShape(circuitjson)
+    stochastic = set(stochasticCells(circuitjson))
+    stochasticcol = firstStochasticColumn(circuitjson)
+
+    state = runFused(zeroState(rowcount), circuitjson, 0, stochasticcol)
+    if stochasticcol == depth:
+        statevector = flatten(state).copy()
+        return SimulationResult(statevector, {}, np.abs(statevector) ** 2)
+
+    branches = [(1.0, state)]
+    for x in range(stochasticcol, depth):
+        for index, gatejson in enumerate(circuitColumn(circuitjson, x)):
+            if (x, index) not in stochastic:
+                for _, branch in branches:
+                    applyGate(branch, gatejson, index, rowcount)
+                continue
+
+            one = controlIndex([index], rowcount)
+            zero = list(one)
+            zero[rowcount - index] = 0
+            zero = tuple(zero)
+            split = []
+            for weight, branch in branches:
+                p1 = float(np.sum(np.abs(branch[one]) ** 2))
+                for bit, p in [(0, 1 - p1), (1, p1)]:
+                    if p * weight < 1e-15:
+                        continue
+                    projected = branch.copy()
+                    projected[one if bit == 0 else zero] = 0
+                    projected /= np.sqrt(p)
+                    if bit and gatejson["type"] == "reset":
+                        applyMatrix(projected, paulimatrices["x"], index, [], rowcount)
+                    split.append((weight * p, projected))
+            branches = split
+
+    probabilities = np.zeros(2 ** rowcount)
+    for weight, branch in branches:
+        probabilities += weight * np.abs(flatten(branch)) ** 2
+    return SimulationResult(None, {}, probabilities)
+
+def columnKey(rows, x):
+    return tuple((row["gates"][x]["type"], tuple(row["gates"][x].get("control", [])),
+                  tuple(row["gates"][x].get("params", []))) for row in rows)
+
+class IncrementalSimulator:
+    """Keeps the state after each column so that re-simulating an edited circuit only replays
+    from the first dirty column. Checkpoints are spaced out when keeping every column would pass maxbytes."""
+    def __init__(self, maxbytes=64 * 2 ** 20):
+        self.maxbytes = maxbytes
+        self.rowcount = None
+        self.columnkeys = []
+        self.states = {}
+        self.dirtycol = 0
+        self.replayed = 0
+
+    def reset(self, rowcount):
+        self.rowcount = rowcount
+        self.columnkeys = []
+        self.states = {0: zeroState(rowcount)}
+        self.dirtycol = 0
+
+    def markDirty(self, col):
+        """Called by the editor after it changes a column."""
+        if type(col) is int:
+            self.dirtycol = min(self.dirtycol, col)
+
+    def simulate(self, circuitjson, shots=1000, seed=None):
+        rows = circuitjson["rows"]
+        rowcount = len(rows)
+        depth = len(rows[0]["gates"])
+        if rowcount != self.rowcount:
+            self.reset(rowcount)
+
+        keys = [columnKey(rows, x) for x in range(0, depth)]
+        firstdirty = min(self.dirtycol, depth, len(self.columnkeys))
+        for x in range(0, firstdirty):
+            if keys[x] != self.columnkeys[x]:
+                firstdirty = x
+                break
+
+        #checkpoints past the first dirty column describe a circuit that no longer exists, and checkpoints past the
+        #first stochastic column (which moves earlier when a gate is added after a measurement) already contain
+        #columns that finishSimulation runs again
+        stochasticcol = firstStochasticColumn(circuitjson)
+        for col in list(self.states.keys()):
+            if col > min(firstdirty, stochasticcol):
+                self.states.pop(col)
+
+        statebytes = 16 * 2 ** rowcount
+        interval = max(1, -(-depth * statebytes // self.maxbytes))
+
+        start = max(self.states.keys())
+        state = self.states[start].copy()
+        for x in range(start, stochasticcol):
+            runColumns(state, circuitjson, x, x + 1)
+            if (x + 1) % interval == 0 or x + 1 == stochasticcol:
+                self.states[x + 1] = state.copy()
+
+        self.replayed = max(0, stochasticcol - start)
+        self.columnkeys = keys
+        self.dirtycol = depth
+        return finishSimulation(state, circuitjson, stochasticcol, shots, np.random.default_rng(seed))
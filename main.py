@@ -3,14 +3,23 @@ from time import sleep
 import traceback as tb
 import warnings
 
-print("Quantum engine starting...")
-import qiskit
-print("Loading qiskit version:", qiskit.version.get_version_info())
-import CircuitJSONTools as qcJSON
-import CircuitFileRenderer as qcRENDER
-import QCircuitSimulator as qcSIMULATOR
-import Puzzle as qcPUZZLE
-print("Quantum engine started. Enter a command.")
+#Startup (qiskit, pygame, the IBMQ account thread and the keyboard hook) only runs when main.py is the entry point.
+#Spawned grading workers import this file as __mp_main__ and must not repeat it.
+if __name__ == "__main__":
+    print("Quantum engine starting...")
+    import qiskit
+    print("Loading qiskit version:", qiskit.version.get_version_info())
+    import CircuitJSONTools as qcJSON
+    import CircuitFileRenderer as qcRENDER
+    import QCircuitSimulator as qcSIMULATOR
+    import StatevectorSimulator as qcSV
+    import Puzzle as qcPUZZLE
+    import CircuitCache as qcCACHE
+    import Benchmarks as qcBENCH
+    import Grader as qcGRADER
+    import ParameterSweep as qcSWEEP
+    import keyboard as k
+    print("Quantum engine started. Enter a command.")
 
 config_recall = True
 lastcmd = ""
@@ -51,17 +60,41 @@ def main(killflag):
                 qcJSON.compileCircuit(params)
 
             elif cmd == "simulate":
-                verifyCMD(flags, ['-t', '-b'], params, 1, 1)
+                verifyCMD(flags, ['-t', '-b', '-a', '-c', '-m'], params, 1, 2)
                 circuitjson = qcJSON.loadJSON(params[0])
                 qcJSON.validateJSON(circuitjson)
-                qc = qcJSON.assembleCircuit(circuitjson)
-                result = qcSIMULATOR.simulate(qc)
-                qcSIMULATOR.visualize(result, qc, flags)
+                backend = "native"
+                if '-a' in flags:
+                    backend = "aer"
+                elif '-c' in flags:
+                    backend = "stabilizer"
+                elif '-m' in flags:
+                    backend = "mps"
+                maxbond = int(params[1]) if len(params) > 1 else None
+                result = qcSIMULATOR.simulateJSON(circuitjson, backend=backend, maxbond=maxbond)
+                if hasattr(result, "truncationerror"):
+                    print("MPS max bond:", result.maxbondused, "truncation error:", result.truncationerror)
+                qcSIMULATOR.visualize(result, None, flags)
+
+            elif cmd == "sweep":
+                verifyCMD(flags, ['-p'], params, 3, 6)
+                circuitjson = qcJSON.loadJSON(params[0])
+                qcJSON.validateJSON(circuitjson)
+                qcSWEEP.sweepFile(circuitjson, params[0], params[1:], '-p' in flags)
 
             elif cmd == "preassemble":
+                verifyCMD(flags, ['-s'], params, 1, 2)
                 circuitjson = qcJSON.loadJSON(params[0])
                 qcJSON.validateJSON(circuitjson)
-                qcJSON.preassembleStages(circuitjson)
+                every = int(params[1]) if len(params) > 1 else 1
+                if '-s' in flags:
+                    for col, statevector in qcSV.stageStates(circuitjson, every):
+                        print("Column", col, ":", statevector)
+                else:
+                    for col, qc in qcJSON.stageCircuits(circuitjson, every):
+                        print("Column", col)
+                        print(qc.draw())
+                        print("----------------------------------")
 
             elif cmd == "run":
                 verifyCMD(flags, ['-s', '-t', '-b'], params, 1, 1)
@@ -86,6 +119,23 @@ def main(killflag):
                     else:
                         qcJSON.saveJSON(circuitjson, input("File name: "))
 
+            elif cmd == "benchmark":
+                verifyCMD(flags, [], params, 0, 1)
+                names = params if len(params) > 0 else list(qcBENCH.benchmarks.keys())
+                for name in names:
+                    if name not in qcBENCH.benchmarks:
+                        warnings.warn("Unknown benchmark: " + name)
+                        raise InternalCommandException
+                    qcBENCH.benchmarks[name]()
+
+            elif cmd == "cache":
+                verifyCMD(flags, ['-c'], params, 0, 0)
+                for name, stats in qcCACHE.cacheStats().items():
+                    print(name + ":", stats)
+                if '-c' in flags:
+                    qcCACHE.clearCaches()
+                    print("Caches cleared.")
+
             elif cmd == "kill":
                 verifyCMD(flags, [], params, 0, 0)
                 killflag["kill"] = True
@@ -93,13 +143,28 @@ def main(killflag):
                 sleep(0.02) #for thread to exit
 
             elif cmd == "puzzle":
-                verifyCMD(flags, [], params, 1, 1)
+                verifyCMD(flags, ['-a'], params, 1, 1)
+                qcSIMULATOR.checkbackend = "aer" if '-a' in flags else None
                 qcPUZZLE.loadPuzzle(params[0])
 
             elif cmd == "puzzleset":
-                verifyCMD(flags, [], params, 0, 0)
+                verifyCMD(flags, ['-a'], params, 0, 0)
+                qcSIMULATOR.checkbackend = "aer" if '-a' in flags else None
                 qcPUZZLE.loadPuzzleset("puzzleset")
 
+            elif cmd == "buildpack":
+                verifyCMD(flags, [], params, 0, 1)
+                qcPUZZLE.buildPuzzlePack(params[0] if len(params) > 0 else "puzzleset")
+
+            elif cmd == "solve":
+                verifyCMD(flags, ['-h'], params, 1, 2)
+                maxdepth = int(params[1]) if len(params) > 1 else qcPUZZLE.defaultmaxdepth
+                qcPUZZLE.solve(params[0], '-h' in flags, maxdepth)
+
+            elif cmd == "grade":
+                verifyCMD(flags, [], params, 2, 3)
+                qcGRADER.gradeSubmissions(params[0], params[1], params[2] if len(params) > 2 else None)
+
             elif cmd == "editpuzzle":
                 verifyCMD(flags, [], params, 1, 1)
                 qcPUZZLE.editPuzzle(params[0])
@@ -153,7 +218,6 @@ def handleListCmds(flags, params):
             commandlist.append(l[1:].strip())
     print(commandlist)
 
-import keyboard as k
 import threading as t
 
 def monitor(killflag):
@@ -0,0 +1,5 @@
+import os
+import sys
+
+#the engines are flat top level modules, so the tests import them from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,60 @@
+import numpy as np
+import StatevectorSimulator
+import StabilizerSimulator
+import MPSSimulator
+import ReversibleSimulator
+from RandomCircuits import randomCircuit
+
+#Every engine against the exact distribution of StatevectorSimulator.exactJSON on small random circuits.
+
+shots = 4000
+
+def totalVariation(counts, probabilities):
+    total = sum(counts.values())
+    outcomes = set(counts) | set(probabilities)
+    return 0.5 * sum(abs(counts.get(o, 0) / total - probabilities.get(o, 0.0)) for o in outcomes)
+
+def test_statevector():
+    gates = ["h", "x", "y", "rx", "ry", "rz", "u", "empty"]
+    for seed in range(0, 10):
+        circuitjson = randomCircuit(4, 6, gates, ["cx", "cy", "crz", "ccx", "cswap", "swap"], seed=seed)
+        exact = StatevectorSimulator.exactJSON(circuitjson)
+        result = StatevectorSimulator.simulateJSON(circuitjson, shots, seed=seed)
+        assert np.allclose(result.get_statevector(), exact.get_statevector())
+        assert totalVariation(result.counts, exact.get_probabilities()) < 0.05
+
+def test_statevector_measurements():
+    """Mid circuit measurements run one trajectory per shot, so fewer shots and a looser bound."""
+    for seed in range(0, 5):
+        circuitjson = randomCircuit(3, 6, ["h", "ry", "m", "reset"], ["cx", "crx"], seed=seed)
+        result = StatevectorSimulator.simulateJSON(circuitjson, 1000, seed=seed)
+        assert totalVariation(result.counts, StatevectorSimulator.exactJSON(circuitjson).get_probabilities()) < 0.1
+
+def test_stabilizer():
+    for seed in range(0, 10):
+        circuitjson = randomCircuit(5, 8, ["h", "x", "y", "z", "empty"], ["cx", "cy", "cz", "swap"], seed=seed)
+        result = StabilizerSimulator.simulateJSON(circuitjson, shots, seed=seed)
+        assert totalVariation(result.counts, StatevectorSimulator.exactJSON(circuitjson).get_probabilities()) < 0.05
+
+def test_stabilizer_measurements():
+    for seed in range(0, 5):
+        circuitjson = randomCircuit(4, 6, ["h", "x", "m", "reset"], ["cx", "cz"], seed=seed)
+        result = StabilizerSimulator.simulateJSON(circuitjson, 1000, seed=seed)
+        assert totalVariation(result.counts, StatevectorSimulator.exactJSON(circuitjson).get_probabilities()) < 0.1
+
+def test_mps():
+    gates = ["h", "x", "rx", "ry", "rz", "u", "empty"]
+    for seed in range(0, 10):
+        circuitjson = randomCircuit(5, 6, gates, ["cx", "crz", "ccx", "cswap", "swap"], seed=seed)
+        result = MPSSimulator.simulateJSON(circuitjson, shots, maxbond=32, seed=seed)
+        assert result.truncationerror < 1e-9
+        assert totalVariation(result.counts, StatevectorSimulator.exactJSON(circuitjson).get_probabilities()) < 0.05
+
+def test_reversible():
+    for seed in range(0, 10):
+        circuitjson = randomCircuit(6, 8, ["x", "reset", "m", "empty"], ["cx", "ccx", "swap", "cswap"], seed=seed)
+        exact = StatevectorSimulator.exactJSON(circuitjson)
+        result = ReversibleSimulator.simulateJSON(circuitjson, shots)
+        assert len(exact.get_probabilities()) == 1
+        assert result.counts == {outcome: shots for outcome in exact.get_probabilities()}
+        assert np.allclose(result.probabilities, exact.probabilities)
@@ -0,0 +1,34 @@
+import copy
+import random
+import StatevectorSimulator
+from StatevectorSimulator import IncrementalSimulator
+from RandomCircuits import emptyCircuit, randomCircuit
+
+def test_gate_after_terminal_measurement():
+    """A measurement that stops being the last gate of its row moves the first stochastic column earlier."""
+    incremental = IncrementalSimulator()
+    circuitjson = emptyCircuit(2, 3)
+    circuitjson["rows"][0]["gates"][0] = {"type": "x"}
+    circuitjson["rows"][0]["gates"][1] = {"type": "m"}
+    circuitjson["rows"][1]["gates"][1] = {"type": "h"}
+    incremental.simulate(circuitjson, 100, seed=1)
+
+    circuitjson["rows"][0]["gates"][2] = {"type": "x"}
+    expected = StatevectorSimulator.simulateJSON(circuitjson, 100, seed=1).counts
+    assert incremental.simulate(circuitjson, 100, seed=1).counts == expected
+    assert set(expected) == set(StatevectorSimulator.exactJSON(circuitjson).get_probabilities())
+
+def test_random_edits():
+    rng = random.Random(0)
+    gates = ["h", "x", "rx", "ry", "m", "reset", "empty"]
+    for seed in range(0, 10):
+        incremental = IncrementalSimulator()
+        circuitjson = randomCircuit(3, 6, gates, ["cx", "crz"], seed=seed)
+        for _ in range(0, 8):
+            edited = copy.deepcopy(circuitjson)
+            row, col = rng.randrange(0, 3), rng.randrange(0, 6)
+            if edited["rows"][row]["gates"][col]["type"] != "multi" and "control" not in edited["rows"][row]["gates"][col]:
+                edited["rows"][row]["gates"][col] = {"type": rng.choice(["h", "x", "m", "empty"])}
+                circuitjson = edited
+            expected = StatevectorSimulator.simulateJSON(circuitjson, 50, seed=seed).counts
+            assert incremental.simulate(circuitjson, 50, seed=seed).counts == expected
@@ -0,0 +1,37 @@
+import numpy as np
+from StatevectorSimulator import SimulationResult
+from PuzzleValidation import validateResultsSequential
+
+#Sequential results validation with a perfect sampler, which draws shots from the true distribution of the circuit.
+
+def sequentialRuns(target, true, seeds=20, tolerance=0.1):
+    """(passes, average shots) over seeded runs."""
+    target = SimulationResult(None, {}, np.array(target, dtype=float))
+    passes = 0
+    shots = []
+    for seed in range(0, seeds):
+        rng = np.random.default_rng(seed)
+        passed, used = validateResultsSequential(lambda n: rng.multinomial(n, true).astype(float), target, tolerance)
+        passes += passed
+        shots.append(used)
+    return passes, float(np.mean(shots))
+
+def test_correct_answers_use_fewer_shots_than_a_fixed_check():
+    for distribution in [[0.5, 0.5], [0.25, 0.75], [0.5, 0, 0, 0.5]]:
+        passes, shots = sequentialRuns(distribution, distribution)
+        assert passes == 20
+        assert shots < 1000
+
+def test_deterministic_target_decides_in_tens_of_shots():
+    target = np.eye(32)[26]
+    passes, shots = sequentialRuns(target, target)
+    assert passes == 20
+    assert shots <= 64
+
+def test_wrong_answers_fail_early():
+    passes, shots = sequentialRuns([0.5, 0.5], [1, 0])
+    assert passes == 0
+    assert shots <= 64
+    passes, shots = sequentialRuns(np.eye(4)[1], [0, 0.5, 0.5, 0])
+    assert passes == 0
+    assert shots <= 64